@@ -19,9 +19,32 @@
 #    You should have received a copy of the GNU Affero General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import time
+startTime = time.time()
 import os
+import sys
+import multiprocessing
 from optparse import OptionParser
 import graphicoreBMFB as bmfb
+importTime = time.time() - startTime
+
+def loadInstructions(instructions):
+    """Return the instructions loaded from the json file instructions, the font folder is the folder of the file if not set."""
+    instructionsData = bmfb.loadInstructions(instructions)
+    # for debugging
+    # bmfb.writeJson(settings['outputFolder'] + '/' + 'optionsmerged.jsn', instructionsData)
+    folderSource = 'specified in the options-file.'
+    if 'folder' not in instructionsData['font']:
+        instructionsData['font']['folder'] = os.path.dirname(instructions)
+        folderSource = 'the directory of the options-file.'
+    bmfb.vprint('the font source folder is:', instructionsData['font']['folder'], 'this was', folderSource, level = 1)
+    return instructionsData
+
+def loadFont(instructionsData):
+    """Return the font of instructionsData for the FontforgeGenerator, without glyphs if they are streamed (generator.streamWindow)."""
+    if instructionsData['generator']['streamWindow']:
+        return bmfb.Font(instructionsData)
+    return bmfb.fontFromFolder(instructionsData)
 
 def main():
     parser = OptionParser()
@@ -31,7 +54,17 @@ def main():
             'what action to perform',
             '1. "font": generate a font with FontForge.',
             '2. "classes": generate classes for kerning.',
-            '3. dist: A number is added to the distance value (i.e. left or right side bearing) of a kerning class and removed from all possible kerning partners or vice versa. The argument before the json file name of the BMF font MUST be the kerning class to work on.',
+            '3. "bitmap": generate bitmap fonts (BDF, PCF, PSF2) without outlines and without FontForge.',
+            '4. "import": import glyphs into the BMF format from the BDF fonts or PNG sprite sheets given by --source. PNGs need --grid.',
+            '5. "pack": write all glyph files of the glyph folder into one glyph archive (.bmfa), use it by setting font.glyphFolder to the archive.',
+            '6. "unpack": write the glyph files of the glyph archive set as font.glyphFolder into a folder.',
+            '7. "merge": merge kerning classes with the same kerning and distance, writes kerningClasses, kern and distances to ./generated/{fileName}_kerning_merged.jsn.',
+            '8. "autokern": make the kern table from the space between the ink of the glyphs of each pair of kerning classes, see generator.autoKernGap, writes ./generated/{fileName}_kerning_auto.jsn.',
+            '9. "specimen": write PNG and SVG specimens of generator.specimenText to ./generated/{fileName}_specimen.png and .svg without FontForge. All json files given as arguments are done in one run.',
+            '10. "features": write the kerning classes, kern and the ligatures as one .fea file to ./generated/{digest}_{generator.generatedFeatureFile} without FontForge. Fonts with the same features share one file. All json files given as arguments are done in one run.',
+            '11. "benchmark": write --glyph-count and a quarter as many random glyphs to ./generated/benchmark_{count}.bmfa and build fonts of them with the options of the json file, loaded at once and streamed (generator.streamWindow, 64 if not set). Prints the time and the peak memory of each build and fails if the streamed build holds more glyphs than its window or its memory grows per glyph as much as without streaming.',
+            '12. "family": build the fonts of all json files given as arguments in --jobs processes, the longest first as expected from ./generated/buildhistory.jsn, writes ./generated/family_schedule.jsn with the expected and actual times.',
+            '13. dist: A number is added to the distance value (i.e. left or right side bearing) of a kerning class and removed from all possible kerning partners or vice versa. The argument before the json file name of the BMF font MUST be the kerning class to work on.',
             '[default: %default]',
         )))
     parser.add_option('-l', '--left',
@@ -40,18 +73,50 @@ def main():
     parser.add_option('-r', '--right',
         action='store', type='int', dest='right', default=1,
         help='if action is "classes": integer value of the width of the right Edge (first kerning classes, later on the left side of a kerning pair) [default: %default]')
+    parser.add_option('-T', '--tolerance',
+        action='store', type='int', dest='tolerance', default=None,
+        help='if action is "classes": put edges that differ by at most this many raster units into one class, overrides generator.classTolerance')
+    parser.add_option('-C', '--class-limit',
+        action='store', type='int', dest='classLimit', default=None,
+        help='if action is "classes": the most classes for each side, overrides generator.classLimit')
     parser.add_option('-A', '--add',
         action='store', type='int', dest='add', default=0,
         help='if action is "dist": the integer value to add to the kerning of class  [default: %default]')
     parser.add_option('-R', '--remove',
         action='store', type='int', dest='remove', default=0,
         help='if action is "dist": the integer value to remove from the kerning of class  [default: %default]')
+    parser.add_option('-s', '--source',
+        action='append', type='string', dest='sources', default=[],
+        help='if action is "import": a .bdf or .png file to import glyphs from, can be used more than once')
+    parser.add_option('-g', '--grid',
+        action='store', type='string', dest='grid', default=None,
+        help='if action is "import": a json file describing the grid of the PNG sprite sheets, see graphicoreBMFB.Importer.importSheet')
+    parser.add_option('-G', '--glyph-count',
+        action='store', type='int', dest='glyphCount', default=20000,
+        help='if action is "benchmark": the count of glyphs of the benchmark font [default: %default]')
+    parser.add_option('-j', '--jobs',
+        action='store', type='int', dest='jobs', default=0,
+        help='if action is "family": the count of fonts built at a time, 0 for one per cpu [default: %default]')
     parser.add_option("-v", "--verbose", dest="verbose", type="int", default=0,
         help="print status messages to stdout, the higher the value the more you get [min: 0, max: none but > 3 was not used now, default: %default]")
     parser.add_option("-q", "--quiet", action="store_true", dest="quiet",
         help="don't print status messages to stdout [default]")
 
-    parser.set_defaults(notate=True, verbose=0, quiet=False)
+    parser.add_option("-n", "--dry-run", action="store_true", dest="dryRun",
+        help="if action is \"font\": don't build the font, only compute its metrics, kerning statistics and unresolved kerning classes into ./generated/{fileName}_dryrun.jsn, without FontForge [default: %default]")
+    parser.add_option("-e", "--events",
+        action='store', type='string', dest='events', default=None,
+        help="append the events of the action as lines of json with the build id, the font and glyph names to this file")
+    parser.add_option("-E", "--event-level",
+        action='store', type='int', dest='eventLevel', default=3,
+        help="if --events is given: the highest level of the events that are written, like --verbose [default: %default]")
+    parser.add_option("-b", "--build-id",
+        action='store', type='string', dest='buildId', default=None,
+        help="if --events is given: the build id of the events, to group the events of many fonts or actions [default: a random id]")
+    parser.add_option("-t", "--timing", action="store_true", dest="timing",
+        help="append the startup time and the duration of the action to the timings file (bmfb.settings['timingsFile'] in the output folder) [default: %default]")
+
+    parser.set_defaults(notate=True, verbose=0, quiet=False, timing=False, dryRun=False)
     (options, args) = parser.parse_args()
     if not options.quiet and options.verbose >= 0:
         bmfb.settings['verbosityLevel'] = options.verbose
@@ -63,29 +128,110 @@ def main():
         bmfb.vprint('please specify the instructions json file to work on, use the -h option to see some help', level = 0)
         exit(2)
 
+    eventLog = None
+    if options.events:
+        eventLog = bmfb.openEventLog(options.events, options.eventLevel, options.buildId)
+    #the exit status, not 0 if some part of the action failed
+    status = 0
+    actionStart = time.time()
+    #more values for the timings file
+    timing = {}
+    bmfb.vprint('startup took %.3f seconds, importing graphicoreBMFB %.3f seconds' % (actionStart - startTime, importTime), level = 1)
     bmfb.vprint('function main on', instructions, 'current working directory', os.getcwd(), level = 1)
-    instructionsData = bmfb.loadInstructions(instructions)
-    # for debugging
-    # bmfb.writeJson(settings['outputFolder'] + '/' + 'optionsmerged.jsn', instructionsData)
-    folderSource = 'specified in the options-file.'
-    if 'folder' not in instructionsData['font']:
-        instructionsData['font']['folder'] = os.path.dirname(instructions)
-        folderSource = 'the directory of the options-file.'
-    bmfb.vprint('the font source folder is:', instructionsData['font']['folder'], 'this was', folderSource, level = 1)
+    instructionsData = loadInstructions(instructions)
 
     # g = generator(fontName, './fonts/'+fontName);
-    if options.action == 'font':
-        bmfb.vprint('generating a font from instructions: …', level = 1)
+    if options.action == 'font' and options.dryRun:
+        bmfb.vprint('computing the metrics of a font from instructions: …', level = 1)
         font = bmfb.fontFromFolder(instructionsData)
+        generator = bmfb.DryRunGenerator(instructionsData, font)
+        generator.generate()
+    elif options.action == 'font':
+        bmfb.vprint('generating a font from instructions: …', level = 1)
+        font = loadFont(instructionsData)
         generator = bmfb.FontforgeGenerator(instructionsData, font)
         generator.generate()
+    elif options.action == 'bitmap':
+        bmfb.vprint('generating a bitmap font from instructions: …', level = 1)
+        font = bmfb.fontFromFolder(instructionsData)
+        generator = bmfb.BitmapGenerator(instructionsData, font)
+        generator.generate()
+    elif options.action == 'import':
+        importer = bmfb.Importer(instructionsData)
+        grid = bmfb.loadJson(options.grid) if options.grid else None
+        for source in options.sources:
+            if source.lower().endswith('.png'):
+                if grid is None:
+                    bmfb.vprint('please specify the grid of the sprite sheet', source, 'with the --grid option', level = 0)
+                    exit(2)
+                importer.importSheet(source, grid)
+            else:
+                importer.importBDF(source)
+        importer.write()
+    elif options.action == 'pack':
+        bmfb.packGlyphFolder(instructionsData)
+    elif options.action == 'unpack':
+        bmfb.unpackGlyphArchive(instructionsData)
     elif options.action == 'classes':
         bmfb.vprint('generating classes for kerning:','left is', options.left, 'right is', options.right, '…', level = 1)
         font = bmfb.fontFromFolder(instructionsData)
         generator = bmfb.KerningClassesGenerator(instructionsData, font)
         generator.leftEdge = options.left
         generator.rightEdge = options.right
+        if options.tolerance is not None:
+            generator.data['classTolerance'] = options.tolerance
+        if options.classLimit is not None:
+            generator.data['classLimit'] = options.classLimit
+        generator.generate()
+    elif options.action == 'merge':
+        bmfb.vprint('merging kerning classes …', level = 1)
+        font = bmfb.Font(instructionsData)
+        generator = bmfb.KerningMergeGenerator(instructionsData, font)
+        generator.generate()
+    elif options.action == 'autokern':
+        bmfb.vprint('kerning automatically …', level = 1)
+        font = bmfb.fontFromFolder(instructionsData)
+        generator = bmfb.AutoKerningGenerator(instructionsData, font)
         generator.generate()
+    elif options.action == 'specimen':
+        for fileName in args:
+            #the instructions of the last argument are already loaded
+            data = instructionsData if fileName == args[-1] else loadInstructions(fileName)
+            bmfb.vprint('writing a specimen of', fileName, '…', level = 1)
+            font = bmfb.fontFromFolder(data)
+            generator = bmfb.SpecimenGenerator(data, font)
+            generator.generate()
+    elif options.action == 'features':
+        for fileName in args:
+            data = instructionsData if fileName == args[-1] else loadInstructions(fileName)
+            font = bmfb.fontFromFolder(data)
+            generator = bmfb.FeatureFileGenerator(data, font)
+            bmfb.vprint('the features of', fileName, 'are in', generator.generate(), level = 0)
+    elif options.action == 'benchmark':
+        report = bmfb.runBenchmark(instructionsData, options.glyphCount, instructionsData['generator']['streamWindow'] or 64)
+        bmfb.vprint('the memory grows by %.3f kB per glyph loaded at once and by %.3f kB per glyph streamed, at most %d glyphs were held at once'
+            % (report['growth']['loaded'], report['growth']['streamed'], report['mostHeldGlyphs']), level = 0)
+        for failure in report['failed']:
+            bmfb.vprint(failure, level = 0)
+        timing['glyphs'] = options.glyphCount
+        timing['streamWindow'] = report['window']
+        timing['processes'] = instructionsData['generator']['processes']
+        #kilobytes on linux
+        timing['builds'] = report['builds']
+        timing['growth'] = report['growth']
+        if report['failed']:
+            status = 1
+    elif options.action == 'family':
+        instructionsFiles = [(fileName, instructionsData if fileName == args[-1] else loadInstructions(fileName)) for fileName in args]
+        arguments = [sys.executable, os.path.abspath(__file__), '-v', str(bmfb.settings['verbosityLevel'])]
+        if options.events:
+            #all builds write to the same event log with the same build id
+            arguments += ['-e', options.events, '-E', str(options.eventLevel), '-b', eventLog.buildId]
+        if options.timing:
+            arguments += ['-t']
+        report = bmfb.buildFamily(instructionsFiles, options.jobs or multiprocessing.cpu_count(), arguments)
+        if report['failed']:
+            status = 1
     elif options.action == 'dist':
         #remove or add a distance from all kerning pairs of this class
         # reflect this in the dist table
@@ -101,6 +247,14 @@ def main():
         generator.generate()
     else:
        bmfb.vprint('No valid action given.', options.action, 'is not an action')
+    actionTime = time.time() - actionStart
+    if options.timing:
+        bmfb.recordTiming(options.action, instructionsData['font']['fileName'], actionTime,
+            startup = round(actionStart - startTime, 4), imports = round(importTime, 4), **timing)
+    bmfb.log(1, 'actionDone', u'the action {action} took {seconds:.3f} seconds', action = options.action, seconds = actionTime)
+    bmfb.closeEventLog()
+    if status:
+        exit(status)
     bmfb.vprint ('OK')
 if __name__ == '__main__':
     main()
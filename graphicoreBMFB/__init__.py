@@ -28,8 +28,25 @@ import codecs
 import math
 import json
 import random
-
-import fontforge
+import hashlib
+import tempfile
+import time
+import multiprocessing
+import bisect
+import collections
+import contextlib
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import sfnt
+import bitmapformats
+import importers
+import glypharchive
+import specimen
+import feafile
+import scheduler
 
 #these values are not changeable by the option files
 #but possibly via commandline options and of course programmatically
@@ -38,6 +55,12 @@ settings = {
     #this will protect against infinite recursive loading of optionfiles
     'maxInstructionsLoadingDepth' : 50,
     'verbosityLevel': -1,
+    #recordTiming appends one json object per line to this file in outputFolder
+    'timingsFile' : 'timings.jsonl',
+    #the durations of the last builds of each font in outputFolder, buildFamily starts the longest builds first
+    'historyFile' : 'buildhistory.jsn',
+    #the glyph names and codepoints UnicodeAndNames knows, see getNameTable
+    'nameTable' : os.path.join(os.path.dirname(os.path.abspath(__file__)), 'glyphlist.txt'),
     #get more at http://www.microsoft.com/typography/otspec/name.htm and extend these if needed
     # I did not get it to work with the string names fontforge uses, but fontforge took these numeric values
     'sfntLookup':
@@ -63,6 +86,31 @@ settings = {
 }
 def version():
     return '0.1'
+
+#fontforge is imported by importFontforge() when it is needed, everything else works without it
+fontforge = None
+
+def importFontforge():
+    """Import the fontforge module on first use and return it. Raise GeneratorError if it is not available."""
+    global fontforge
+    if fontforge is None:
+        start = time.time()
+        try:
+            import fontforge as module
+        except ImportError, e:
+            raise GeneratorError('the python bindings of fontforge are needed for this, but could not be imported: {0}'.format(e))
+        fontforge = module
+        vprint('imported fontforge in %.3f seconds' % (time.time() - start), level = 2)
+    return fontforge
+
+def recordTiming(action, name, seconds, **kwargs):
+    """Append the duration of action for name (and anything in kwargs) as one line of json to settings['outputFolder']/settings['timingsFile']."""
+    entry = {'action' : action, 'name' : name, 'seconds' : round(seconds, 4), 'time' : int(time.time())}
+    entry.update(kwargs)
+    fileName = '%s/%s' % (settings['outputFolder'], settings['timingsFile'])
+    with codecs.open(fileName, mode='a', encoding='utf-8') as file:
+        file.write(json.dumps(entry, sort_keys=True) + u'\n')
+
 def vprint(*args, **kwargs):
     """Print *args to stdout if level is smaller or equal to settings['verbosityLevel']."""
     level = int(kwargs.get('level', 0))
@@ -77,6 +125,78 @@ def vprint(*args, **kwargs):
             sys.stdout.write(' ')
     sys.stdout.write('\n')
 
+class EventLog(object):
+    """
+    Write events as lines of json to a file, so the logs of many builds can be aggregated by machines.
+
+    Each line has the time, the build id, the process id, the level, the
+    event name, the formatted message, the fields of context (e.g. the font)
+    and the fields of the event (e.g. the glyph). Each line is appended with
+    one system call, so the processes of a pool and parallel builds can
+    write to the same file.
+
+    """
+    def __init__(self, fileName, level = 3, buildId = None):
+        self.fileName = fileName
+        self.level = level
+        self.buildId = buildId or hashlib.sha1('%r %d %r' % (time.time(), os.getpid(), random.random())).hexdigest()[:12]
+        self.context = {}
+        self._fd = os.open(fileName, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0644)
+
+    def write(self, level, event, message, fields):
+        entry = {'time' : round(time.time(), 4), 'build' : self.buildId, 'pid' : os.getpid(),
+            'level' : level, 'event' : event, 'message' : message}
+        entry.update(self.context)
+        entry.update(fields)
+        os.write(self._fd, json.dumps(entry, sort_keys = True, default = repr) + '\n')
+
+    def close(self):
+        os.close(self._fd)
+
+_eventLog = None
+
+def openEventLog(fileName, level = 3, buildId = None):
+    """Write all following events up to level to fileName, see EventLog. Return the EventLog."""
+    global _eventLog
+    closeEventLog()
+    _eventLog = EventLog(fileName, level, buildId)
+    vprint('writing events up to level', level, 'of the build', _eventLog.buildId, 'to', fileName, level = 2)
+    return _eventLog
+
+def closeEventLog():
+    global _eventLog
+    if _eventLog is not None:
+        _eventLog.close()
+        _eventLog = None
+
+def setLogContext(**fields):
+    """Add fields to all following events of the event log, e.g. font = the name of the font that is built."""
+    if _eventLog is not None:
+        _eventLog.context.update(fields)
+
+def isLogged(level):
+    """Return True if events at level are printed or written to the event log, to skip work that is only done for them."""
+    return level <= settings['verbosityLevel'] or (_eventLog is not None and level <= _eventLog.level)
+
+def log(level, event, message, *args, **fields):
+    """
+    Print the message like vprint and write the event with fields to the event log, if either one takes level.
+
+    message is a format string for args and fields, it is only formatted
+    if the event is printed or logged, so a call for a level that is not
+    taken costs little more than the call itself.
+
+    """
+    printed = level <= settings['verbosityLevel']
+    logged = _eventLog is not None and level <= _eventLog.level
+    if not printed and not logged:
+        return
+    text = message.format(*args, **fields)
+    if printed:
+        vprint(text, level = level)
+    if logged:
+        _eventLog.write(level, event, text, fields)
+
 defaults = {
 # these options are written with double quotes because that yields in valid json, making copy and paste faster
 # expept booleans, which are first letter lowercase in json: false and true instead of False and True in Python
@@ -99,6 +219,8 @@ defaults = {
         "filled" : "#",
         #in a glyph this is an empty
         "empty" : ".",
+        #a json file in the outputFolder to keep the codepoints of the private use area stable between builds, False to not keep them
+        "puaFile" : "pua.jsn",
         "classRightIndicator": u"@_1R",
         "classLeftIndicator": u"@_2L"
     },
@@ -143,11 +265,89 @@ defaults = {
         #making outsideCornerRadius (width/2) -1 is the best solution I know so far
         "outsideCornerRadius" : 0,
         "insideCornerRadius" : 0,
-        #a .fea file that will be generated (and then merged).
+        #true draws the pixel shapes as TrueType outlines: each rounded corner is two quadratic curves
+        #with off curve points on integer coordinates. Use it with "ttf" in fileFormats
+        #(and "webFontSource"), fontforge then doesn't convert the cubic curves and the glyf table is smaller
+        "quadratic" : False,
+        #a .fea file with the kerning and the ligatures, written by the FeatureFileGenerator and merged by the FontforgeGenerator
+        #in one step, instead of adding each ligature and the kerning classes through fontforge. false to not use it
         "generatedFeatureFile" : False,
         "generatedClassesFile" : "classes.jsn",
+        #the KerningClassesGenerator puts edges that differ by at most classTolerance into one class, 0 only puts equal edges together
+        #classDistance is "hamming" (the count of differing raster units) or "profile" (the biggest difference
+        #of the empty raster units between the edge and the ink of a line)
+        "classTolerance" : 0,
+        "classDistance" : "hamming",
+        #the most classes for each side, the classes with the fewest glyphs are merged into their nearest class, false for no limit
+        "classLimit" : False,
+        #a json file with the representative of each class and the distance of each glyph to it, written if classes
+        #are made with a tolerance or a limit, false to not write it
+        "classDeviationsFile" : "class_deviations.jsn",
         "generatedKerningFile" : "kerning.jsn",
+        "generatedMergedKerningFile" : "kerning_merged.jsn",
+        "generatedAutoKerningFile" : "kerning_auto.jsn",
+        "generatedDryRunFile" : "dryrun.jsn",
+        #the lines of text of the specimens written by the SpecimenGenerator
+        "specimenText" : ["graphicore Bitmap Font Building", "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz", "0123456789 !?&@ fi ffi Th st ch"],
+        #the features applied to the text, any of "kern", "liga" and "dlig"
+        "specimenFeatures" : ["kern", "liga"],
+        #"png" and/or "svg"
+        "specimenFormats" : ["png", "svg"],
+        #pixels per raster unit in the specimens
+        "specimenPixels" : 4,
+        #space around the text and between the lines, in raster units
+        "specimenMargin" : 2,
+        "specimenLeading" : 2,
+        #the AutoKerningGenerator kerns each pair of classes so the narrowest gap between them is autoKernGap raster units
+        #but the ink in diagonally adjacent lines never comes closer than autoKernMinGap
+        "autoKernGap" : 1,
+        "autoKernMinGap" : 1,
+        #the biggest absolute value of an automatic kerning pair
+        "autoKernLimit" : 3,
+        #besides anything fontforge can generate, "woff" and "woff2" are possible
         "fileFormats": ['otf', 'sfd'],
+        #the format that is compiled once by fontforge and then wrapped into each of woff and woff2
+        "webFontSource" : "otf",
+        #zlib compression level for woff 0-9 and brotli quality for woff2 0-11
+        "woffCompressionLevel" : 9,
+        "woff2CompressionLevel" : 11,
+        #list of ppem sizes to embed as native bitmaps (EBDT/EBLC) into otf and ttf files
+        #each size must be a multiple of em / unit, that is where one raster unit is one or more whole pixels
+        "bitmapStrikes" : [],
+        #the formats written by the BitmapGenerator, any of "bdf", "pcf" and "psf" (PSF2)
+        "bitmapFormats" : ["bdf"],
+        #pixels per raster unit in the files of the BitmapGenerator
+        "bitmapScale" : 1,
+        #glyphs with the same lines and distances are drawn once, the others become
+        #"reference" (a reference to the drawn glyph) or "copy" (a copy of its contours and hints)
+        #false draws every glyph. fontforge decomposes references when writing cff based fonts
+        "duplicateGlyphs" : False,
+        #a json file listing the groups of duplicate glyphs, written by the FontforgeGenerator, e.g. "duplicates.jsn"
+        #false to not write it
+        "duplicatesReportFile" : False,
+        #glyphs that are exactly another glyph (the base) plus a third glyph (the mark) at an offset
+        #are made of references to both, see Font.getDecompositions, false draws every glyph
+        "composites" : False,
+        #rasterize each composite and the glyph drawn of all its pixels and fail the build if they differ
+        #this draws every composite glyph once more, see FontforgeGenerator.verifyComposites
+        "verifyComposites" : False,
+        #a json file listing the decomposed glyphs, written by the FontforgeGenerator, false to not write it
+        "compositesReportFile" : "composites.jsn",
+        #a json file with the contours, points and hints of each drawn glyph and the bytes of the tables of each generated font
+        #false to not write it
+        "metricsReportFile" : "metrics.jsn",
+        #the most points a drawn glyph may have after simplify, false for no limit. Any glyph over budget fails the build
+        "pointBudget" : False,
+        #dict of glyph name : the most points of this glyph, overrides pointBudget
+        "pointBudgets" : {},
+        #load, draw and insert the glyphs one at a time instead of loading all glyphs first, for very big fonts
+        #at most streamWindow glyphs are loaded or drawn and not yet inserted, false to load all glyphs first
+        #see FontforgeGenerator.streamChars, composites are not made when streaming
+        #the bitmaps of bitmapStrikes are made of each glyph before it is released and kept until the font is generated
+        "streamWindow" : False,
+        #count of processes drawing the outlines of the glyphs, 0 for one per cpu
+        #the outlines are made in a fontforge font in each process and then copied into the target in glyph order
+        "processes" : 1,
         "ffGenerateFlags" : ["opentype", "old-kern", "dummy-dsig"],
         "removeOverlap" : True,
         #an either good idea, but slow
@@ -177,16 +377,50 @@ defaults = {
 #kappa * radius(r) is the distance (d) between the oncurve point and the next ofcurve point needed to draw a sufficient circle
 #a quater circle would be like moveTo((x,y)), curveTo((x, y + d), (x + r - d, y + r), (x + r, y + r)), closPath()
 kappa = 4*((math.sqrt(2)-1)/3)
+#a quarter circle as two quadratic curves: the off curve points are at radius * tan(22.5°) from the ends
+quadraticKappa = math.tan(math.pi / 8)
 class FontError(Exception): pass
 class GeneratorError(Exception): pass
 class OptionsError(Exception): pass
 
+_nameTable = None
+
+def getNameTable():
+    """
+    Return a tuple of two dicts: name : unicode and unicode : name
+
+    They are read once from settings['nameTable'], a file in the format of the
+    Adobe Glyph List: name;codepoint in hex. The first name of a codepoint is its name.
+
+    """
+    global _nameTable
+    if _nameTable is None:
+        name2Unicode = {}
+        unicode2Name = {}
+        with open(settings['nameTable'], 'rb') as file:
+            for line in file:
+                if line.startswith('#'): continue
+                name, uni = line.strip().split(';')
+                uni = int(uni, 16)
+                name2Unicode[name] = uni
+                if uni not in unicode2Name:
+                    unicode2Name[uni] = name
+        _nameTable = (name2Unicode, unicode2Name)
+        vprint('loaded', len(name2Unicode), 'glyph names from', settings['nameTable'], level = 2)
+    return _nameTable
+
+_uniNameRegex = re.compile(r'^(?:uni([0-9A-F]{4})|u([0-9A-F]{4,6}))$')
+
 class UnicodeAndNames(object):
     """
     Does some of the name finding for the author of a font.
 
     Usually lives in an object of Font.
     Will return the same results during its lifetime.
+    Names and codepoints are found in the table of getNameTable(), codepoints
+    from the Private Use Area are stored in puaFile, if given, to keep them
+    the same for all builds. Builds running at the same time share puaFile,
+    new codepoints are given while it is locked and after reading it again.
     """
     _cache = None
     #a dict set manually, if there is a key of a glyph name the ord() value of that value will be retutned as unicodepoint
@@ -196,10 +430,15 @@ class UnicodeAndNames(object):
     #start somewhere, ... there is some space for other usage before
     _nextPUAPoint = 0xE8FF#59647
     nameGetter = None
+    puaFile = None
+    _puaChanged = False
+    _batch = False
 
-    def __init__(self, name2Unicode = {}):
+    def __init__(self, name2Unicode = {}, puaFile = None):
         self._cache = {'name' : {}, 'PUA' : {}}
-        self.name2Unicode.update(name2Unicode)
+        self.name2Unicode = dict(name2Unicode)
+        self.puaFile = puaFile
+        self._reloadPUA()
         #this will be used with map
         def nameGetter(name):
             return self.getUnicodeAndName(name)[1]
@@ -208,10 +447,51 @@ class UnicodeAndNames(object):
     def getPUACodePoint(self, name):
         """Return a codepoint from the private use area for name, if name was requested before, return the old value."""
         if name not in  self._cache['PUA']:
-            self._cache['PUA'][name] = self._nextPUAPoint
-            self._nextPUAPoint += 1
+            if self._batch:
+                self._addPUACodePoint(name)
+            else:
+                with self._lockPUA():
+                    self._reloadPUA()
+                    self._addPUACodePoint(name)
+                    self.savePUA()
         return  self._cache['PUA'][name]
 
+    def _addPUACodePoint(self, name):
+        if name in self._cache['PUA']:#given by another build meanwhile
+            return
+        self._cache['PUA'][name] = self._nextPUAPoint
+        self._nextPUAPoint += 1
+        self._puaChanged = True
+
+    def _reloadPUA(self):
+        """Add the codepoints in puaFile, other builds may have written new ones."""
+        if not self.puaFile or not os.path.exists(self.puaFile):
+            return
+        for name, uni in loadJson(self.puaFile).iteritems():
+            self._cache['PUA'].setdefault(name, uni)
+        if len(self._cache['PUA']):
+            self._nextPUAPoint = max(self._nextPUAPoint, max(self._cache['PUA'].values()) + 1)
+
+    @contextlib.contextmanager
+    def _lockPUA(self):
+        """Hold an exclusive lock on puaFile, without fcntl (not on unix) there is no lock."""
+        if not self.puaFile or fcntl is None:
+            yield
+            return
+        with open(self.puaFile + '.lock', 'ab') as lockFile:
+            fcntl.flock(lockFile.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lockFile.fileno(), fcntl.LOCK_UN)
+
+    def savePUA(self):
+        """Write the codepoints of the private use area to puaFile if they changed."""
+        if not self.puaFile or not self._puaChanged:
+            return
+        writeJson(self.puaFile, self._cache['PUA'])
+        self._puaChanged = False
+
     def _byUserDict(self, name):
         """Return a tuple of unicode codepoint and name if name is a key in self name2Unicode or False."""
         try:
@@ -220,19 +500,25 @@ class UnicodeAndNames(object):
             return False
 
     def _byValue(self, name):
-        """Return a tuple of unicode codepoint and name if name is the string representation of the unicodepoint otherwise Retun False. Name is translated by fontforge.nameFromUnicode()."""
+        """Return a tuple of unicode codepoint and name if name is the string representation of the unicodepoint otherwise Retun False. Name is taken from the name table or made like uniXXXX."""
         try:
             uni = ord(name)
-            return (uni, str(fontforge.nameFromUnicode(uni)))
         except TypeError, e:
             return False
+        name = getNameTable()[1].get(uni)
+        if name is None:
+            name = ('uni%04X' if uni <= 0xFFFF else 'u%06X') % uni
+        return (uni, name)
 
     def _byName(self, name):
-        """Return a tuple of unicode codepoint and name or False if name was not found by fontforge.unicodeFromName."""
-        uni = fontforge.unicodeFromName(name)
-        if uni > -1:
-            return (uni, str(name))
-        return False
+        """Return a tuple of unicode codepoint and name or False if name is not in the name table and not like uniXXXX or uXXXX[XX]."""
+        uni = getNameTable()[0].get(name)
+        if uni is None:
+            match = _uniNameRegex.match(name)
+            if match is None:
+                return False
+            uni = int(match.group(1) or match.group(2), 16)
+        return (uni, str(name))
 
     def _byPUA(self, name):
         """Return tuple of a private use area unicodepoint and the given name."""
@@ -255,6 +541,25 @@ class UnicodeAndNames(object):
             self._cache['name'][uni] = returnedName
         return (uni, self._cache['name'][uni])
 
+    def resolveNames(self, names):
+        """
+        Return a dict of name : (unicode, name) for all names, resolved in one pass.
+
+        The names are resolved in sorted order, so the results and new
+        codepoints of the private use area don't depend on the order of
+        later calls. puaFile is locked during the pass and written once at the end.
+
+        """
+        with self._lockPUA():
+            self._reloadPUA()
+            self._batch = True
+            try:
+                result = dict([(name, self.getUnicodeAndName(name)) for name in sorted(set(names))])
+            finally:
+                self._batch = False
+            self.savePUA()
+        return result
+
     def getName(self, name):
         """Return the name that is returned for name by getUnicodeAndName()"""
         return self.getUnicodeAndName(name)[1]
@@ -276,10 +581,12 @@ def loadJson(fileName,  encoding='utf-8'):
     return data
 
 def writeJson(fileName, data, encoding='utf-8'):
-    """Write json to fileName. By default with utf-8 encoding."""
-    with codecs.open(fileName, mode='wb', encoding=encoding) as file:
+    """Write json to fileName. By default with utf-8 encoding. The file is replaced at once, readers never see it half written."""
+    tempName = '%s.%d.tmp' % (fileName, os.getpid())
+    with codecs.open(tempName, mode='wb', encoding=encoding) as file:
         json.dump(data, file, ensure_ascii=False, encoding=encoding, sort_keys=True, indent=1)#
-        vprint('wrote json to %s' % fileName, level = 1)
+    os.rename(tempName, fileName)
+    log(1, 'fileWritten', u'wrote json to {file}', format = 'json', file = fileName)
     return True#no exception...
 
 def loadInstructions(filename):
@@ -338,20 +645,64 @@ class Font(object):
     features = {}
     _classes = None
     names = None
+    #count of glyphs loaded by streamGlyphs that are not released yet
+    heldGlyphs = 0
 
     def __init__(self, instructions, names = False):
+        #each font has its own data and glyphs, so more than one font can be loaded at a time
+        self.data = dict(self.data)
         self.data.update(instructions['font'])
+        self.glyphs = {}
+        setLogContext(font = self.data['fileName'])
         self.features = instructions['features']
-        self.names = (names or UnicodeAndNames(instructions['name2Unicode']))
+        if not names:
+            puaFile = None
+            if self.data['puaFile']:
+                puaFile = '%s/%s' % (settings['outputFolder'], self.data['puaFile'])
+            names = UnicodeAndNames(instructions['name2Unicode'], puaFile)
+            names.resolveNames(self._getAllNames(instructions))
+        self.names = names
+
+    def _getAllNames(self, instructions):
+        """Return a list of all glyph names used by instructions: glyphs, members of kerning classes and ligatures."""
+        names = list(instructions['glyphs'].keys())
+        for members in self.features['kerningClasses'].itervalues():
+            names += members.split(' ')
+        for featureTag in ('liga', 'dlig', 'hlig', 'ccmp'):
+            for sub, by in self.features.get(featureTag, []):
+                names += sub.split(' ') + [by]
+        return names
 
     def setGlyph(self, glyphName, charData):
         name = self.names.getName(glyphName)
         if(name in self.glyphs):
-            vprint('overwriting:', glyphName, u'({0})'.format(name), 'it already exists.', 'It was called:', self.glyphs[name]['rawName'], 'at load time.', level=2)
-        vprint(u'setting Glyph:', glyphName, 'as:', name, level = 3)
+            log(2, 'glyphOverwritten', u'overwriting: {rawName} ({glyph}) it already exists. It was called: {oldName} at load time.',
+                rawName = glyphName, glyph = name, oldName = self.glyphs[name]['rawName'])
+        log(3, 'glyphSet', u'setting Glyph: {rawName} as: {glyph}', rawName = glyphName, glyph = name)
         lines,width = self.normalizeCharData(charData)
         self.glyphs[name] = {'lines':lines, 'width':width, 'rawName' : glyphName}
 
+    def streamGlyphs(self, instructions):
+        """
+        Yield the name of each glyph of instructions in the order of the names, the glyph is loaded and set just before.
+
+        Call releaseGlyph when done with a glyph, so only one glyph at a time is
+        held with its lines, instead of all glyphs like fontFromFolder does.
+
+        """
+        glyphNames = sorted(instructions['glyphs'], key = lambda glyphName: (self.names.getName(glyphName), glyphName))
+        for glyphName, lines in readGlyphs(self, instructions, glyphNames):
+            self.setGlyph(glyphName, lines)
+            self.heldGlyphs += 1
+            yield self.names.getName(glyphName)
+
+    def releaseGlyph(self, name):
+        """Drop the lines and the ink of the glyph with name, keep its width, classes, distances and fingerprint."""
+        data = self.glyphs[name]
+        if data.pop('lines', None) is not None:
+            self.heldGlyphs -= 1
+        data.pop('_ink', None)
+
     def __getattr__(self, name):
         """Some lazy processing to return a dict of kerning-classes."""
         if name == 'classes':
@@ -370,7 +721,8 @@ class Font(object):
                 if name in v:
                     self.glyphs[name]['_classes'].append(k)
             if len(self.glyphs[name]['_classes']) > 2:
-                vprint('glyph', name, 'has more than 2 classes:', len(self.glyphs[name]['_classes']), self.glyphs[name]['_classes'], level=1)
+                log(1, 'tooManyClasses', u'glyph {glyph} has more than 2 classes: {0} {classes}',
+                    len(self.glyphs[name]['_classes']), glyph = name, classes = self.glyphs[name]['_classes'])
         return self.glyphs[name]['_classes']
 
     def getDistances(self, name):
@@ -387,6 +739,121 @@ class Font(object):
             self.glyphs[name]['_dist'] = (dist[0], dist[1])
         return self.glyphs[name]['_dist']
 
+    def getFingerprint(self, name):
+        """Return a hash of the normalized lines and the distances of the glyph with name, glyphs with the same hash are drawn the same."""
+        data = self.glyphs[name]
+        if '_fingerprint' not in data:
+            key = u'%s|%d|%d' % ((u'\n'.join(data['lines']),) + tuple(self.getDistances(name)))
+            data['_fingerprint'] = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return data['_fingerprint']
+
+    def getDuplicateGroups(self):
+        """Return a sorted list of the groups of glyph names that have the same fingerprint, each group is sorted and has at least two names."""
+        byFingerprint = {}
+        for name in self.glyphs:
+            byFingerprint.setdefault(self.getFingerprint(name), []).append(name)
+        return sorted([sorted(group) for group in byFingerprint.itervalues() if len(group) > 1])
+
+    def getInk(self, name):
+        """Return a frozenset of the (x, y) of the filled pixels of the glyph with name, x includes the left distance, y is the line."""
+        data = self.glyphs[name]
+        if '_ink' not in data:
+            left = self.getDistances(name)[0]
+            filled = self.data['filled']
+            data['_ink'] = frozenset([(x + left, y) for y, line in enumerate(data['lines'])
+                for x, val in enumerate(line) if val == filled])
+        return data['_ink']
+
+    def getDecompositions(self, exclude = (), separate = True):
+        """
+        Return a dict of glyph name : (base name, mark name, (x, y)) for glyphs that are exactly a base plus a mark.
+
+        The base has the same position in the glyph, the mark is moved by x
+        raster units to the right and y lines down and has no line in common
+        with the base, it is above or below like an accent. If separate is True the
+        pixels of the mark don't touch those of the base, not even diagonally,
+        so the shapes drawn for both are the same as those drawn for the whole
+        glyph, also with contextual shapes. Otherwise they may touch, which is
+        only right if each pixel is drawn on its own. The biggest possible base
+        is used. A glyph that is decomposed is never a base or mark, neither
+        are the glyphs in exclude.
+
+        """
+        def normalize(ink):
+            left = min([x for x, y in ink])
+            top = min([y for x, y in ink])
+            return (tuple(sorted([(x - left, y - top) for x, y in ink])), (left, top))
+        inked = sorted([(len(self.getInk(name)), name) for name in self.glyphs if self.getInk(name)])
+        shapes = {}#shape : names of glyphs with this shape
+        firstPixels = {}#the first pixel of the ink : names of glyphs with this first pixel
+        decompositions = {}
+        for count, name in inked:
+            ink = self.getInk(name)
+            best = None
+            for pixel in ink:
+                for base in firstPixels.get(pixel, ()):
+                    baseInk = self.getInk(base)
+                    if len(baseInk) >= count or not baseInk <= ink:
+                        continue
+                    rest = ink - baseInk
+                    baseLines = set([y for x, y in baseInk])
+                    if True in [y in baseLines for x, y in rest]:
+                        #marks are above or below the base, like accents
+                        continue
+                    if separate and True in [(x + i, y + j) in baseInk for x, y in rest for i in (-1, 0, 1) for j in (-1, 0, 1)]:
+                        continue
+                    shape, (left, top) = normalize(rest)
+                    if shape not in shapes:
+                        continue
+                    mark = shapes[shape][0]
+                    markLeft, markTop = normalize(self.getInk(mark))[1]
+                    candidate = (-len(baseInk), base, mark, (left - markLeft, top - markTop))
+                    if best is None or candidate < best:
+                        best = candidate
+            if best is not None and name not in exclude:
+                decompositions[name] = best[1:]
+                continue
+            if name in exclude:
+                continue
+            shapes.setdefault(normalize(ink)[0], []).append(name)
+            firstPixels.setdefault(min(ink), []).append(name)
+        return decompositions
+
+    def getBitmap(self, name, scale = 1):
+        """
+        Return a tuple of metrics and the rows of pixels of the glyph with name, cropped to its filled pixels.
+
+        metrics is a tuple (height, width, bearingX, bearingY, advance) where
+        bearingY is the distance from the baseline to the top of the bitmap.
+        Each raster unit becomes a square of scale * scale pixels.
+
+        """
+        data = self.glyphs[name]
+        dist = self.getDistances(name)
+        lines = data['lines']
+        filled = self.data['filled']
+        advance = (data['width'] + sum(dist)) * scale
+        inkRows = [y for y, line in enumerate(lines) if filled in line]
+        if not inkRows:
+            return ((0, 0, 0, 0, advance), [])
+        inkColumns = [x for x in xrange(data['width']) if True in [line[x] == filled for line in lines]]
+        top, bottom = inkRows[0], inkRows[-1]
+        left, right = inkColumns[0], inkColumns[-1]
+        rows = []
+        for line in lines[top:bottom + 1]:
+            row = []
+            for val in line[left:right + 1]:
+                row.extend([val == filled] * scale)
+            rows.extend([row] * scale)
+        metrics = (
+            (bottom - top + 1) * scale,#height
+            (right - left + 1) * scale,#width
+            (dist[0] + left) * scale,#bearingX
+            (len(lines) - self.data['descent'] - top) * scale,#bearingY
+            advance
+        )
+        return (metrics, rows)
+
     def normalizeCharData(self, charData):
         """
         Bring a charData in a normal Form
@@ -419,18 +886,394 @@ class Font(object):
         return (tuple(normal), width)
 
 def fontFromFolder(instructions):
-    """Return a Font object from a BMF stored in a folder (which is standard). In fact this only loads the glyph files from disc."""
+    """
+    Return a Font object from a BMF stored in a folder (which is standard). In fact this only loads the glyph files from disc.
+
+    If font.glyphFolder is a glyph archive file instead of a folder, the glyphs are read from the archive.
+
+    """
     font = Font(instructions)
-    for glyphName, glyphFile in instructions['glyphs'].iteritems():
-        path = '%s/%s/%s' % (font.data['folder'], font.data['glyphFolder'], glyphFile)
+    for glyphName, lines in readGlyphs(font, instructions):
+        font.setGlyph(glyphName, lines)
+    return font
+
+def readGlyphs(font, instructions, glyphNames = None):
+    """
+    Yield (glyphName, lines) for each of glyphNames, by default all glyphs of instructions, one glyph file at a time.
+
+    The lines are read from the glyph folder of font or from the glyph archive
+    if font.glyphFolder is one, at most font.lineCount lines.
+
+    """
+    if glyphNames is None:
+        glyphNames = instructions['glyphs'].keys()
+    glyphSource = '%s/%s' % (font.data['folder'], font.data['glyphFolder'])
+    if os.path.isfile(glyphSource):
+        filled, empty = font.data['filled'], font.data['empty']
+        with glypharchive.GlyphArchive(glyphSource) as archive:
+            vprint('loading glyphs from the archive', glyphSource, level = 2)
+            for glyphName in glyphNames:
+                rows = archive.getRows(instructions['glyphs'][glyphName])[:font.data['lineCount']]
+                yield (glyphName, [u''.join([filled if pixel else empty for pixel in row]) for row in rows])
+        return
+    for glyphName in glyphNames:
+        path = '%s/%s' % (glyphSource, instructions['glyphs'][glyphName])
         lines = []
         with codecs.open(path, mode='r', encoding='utf-8') as file:
             for line in file:
                 lines.append(line)
                 if len(lines) == font.data['lineCount']:
                     break;
-        font.setGlyph(glyphName, lines)
-    return font
+        yield (glyphName, lines)
+
+def _readGlyphRows(path, filled):
+    """Return all lines of the glyph file path as rows of booleans."""
+    with codecs.open(path, mode='r', encoding='utf-8') as file:
+        return [[char == filled for char in line] for line in file.read().splitlines()]
+
+def packGlyphFolder(instructions, fileName = None):
+    """
+    Write all .txt glyph files of the glyph folder of instructions into one glyph archive. Return the fileName of the archive.
+
+    The archive keeps everything that is read from a glyph file: every line
+    and which pixels are filled. Other characters than font.filled become empty.
+    By default the archive is written to settings['outputFolder']/{font.glyphFolder}.bmfa
+
+    """
+    font = Font(instructions)
+    folder = '%s/%s' % (font.data['folder'], font.data['glyphFolder'])
+    if fileName is None:
+        fileName = '%s/%s.bmfa' % (settings['outputFolder'], os.path.basename(font.data['glyphFolder'].rstrip('/')))
+    entries = []
+    for glyphFile in os.listdir(folder):
+        path = '%s/%s' % (folder, glyphFile)
+        if not glyphFile.endswith('.txt') or not os.path.isfile(path): continue
+        entries.append((glyphFile, _readGlyphRows(path, font.data['filled'])))
+    glypharchive.writeArchive(fileName, entries)
+    vprint('packed', len(entries), 'glyph files into', fileName, level = 1)
+    return fileName
+
+def getBuildSignature(instructions):
+    """
+    Return a string of the shape options of instructions, to expect the duration of builds without history.
+
+    These options decide how much is drawn and how it is processed, not
+    the metrics, so the weights of a family usually share a signature.
+
+    """
+    keys = ('contextualShape', 'insideCornerRadius', 'outsideCornerRadius', 'invertOutside',
+        'removeOverlap', 'autoHint', 'quadratic', 'composites', 'fileFormats')
+    return json.dumps([instructions['generator'].get(key) for key in keys])
+
+def buildFamily(instructionsFiles, workers, arguments):
+    """
+    Build the fonts of instructionsFiles, a list of (fileName, instructions), in at most workers processes at a time.
+
+    Each build runs the command arguments + [fileName], its output is written
+    to settings['outputFolder']/{font.fileName}_build.log. The builds expected
+    to take longest start first, see the scheduler module. Successful builds
+    add their duration to settings['outputFolder']/settings['historyFile']. The report of
+    scheduler.getReport is written to settings['outputFolder']/family_schedule.jsn and returned.
+
+    """
+    commands = {}
+    signatures = {}
+    for fileName, instructions in instructionsFiles:
+        key = instructions['font']['fileName']
+        if key in commands:
+            raise OptionsError('{0} and {1} build the same font {2}'.format(commands[key][-1], fileName, key))
+        commands[key] = list(arguments) + [fileName]
+        signatures[key] = getBuildSignature(instructions)
+    historyFile = '%s/%s' % (settings['outputFolder'], settings['historyFile'])
+    history = scheduler.loadHistory(historyFile)
+    expected = scheduler.getExpected(history, signatures)
+    order = scheduler.getOrder(expected)
+    vprint('building', len(order), 'fonts in', workers, 'processes, expected to take %.3f seconds' % scheduler.simulate(expected, order, workers), level = 1)
+    logs = dict([(key, '%s/%s_build.log' % (settings['outputFolder'], key)) for key in commands])
+    results = scheduler.run(commands, order, workers, logs)
+    for key, result in results.iteritems():
+        if result['returncode'] == 0:
+            scheduler.recordDuration(history, key, signatures[key], result['seconds'])
+    scheduler.writeHistory(historyFile, history)
+    report = scheduler.getReport(expected, results, order, workers)
+    writeJson('%s/family_schedule.jsn' % settings['outputFolder'], report)
+    log(0, 'familyBuilt', u'built {fonts} fonts in {total:.3f} seconds, expected {expectedTotal:.3f}, '
+        u'at best {bound:.3f} (longest build {longest}), utilization {utilization:.1%}',
+        fonts = len(results), total = report['total'], expectedTotal = report['expectedTotal'], bound = report['bound'],
+        longest = report['longest'], utilization = report['utilization'])
+    for key in report['failed']:
+        log(0, 'buildFailed', u'the build of {0} failed with the return code {returncode}, see {log}', key,
+            returncode = results[key]['returncode'], log = logs[key])
+    return report
+
+def writeBenchmarkFont(instructions, count = 20000, seed = 0):
+    """
+    Write a glyph archive of count random glyphs and return the instructions to build a font of it, to measure big fonts.
+
+    The glyphs are named u20000 and up (CJK Extension B), each has font.lineCount
+    lines of 4 to 16 raster units and about one of ten is a copy of an earlier glyph.
+    The archive is written to settings['outputFolder']/benchmark_{count}.bmfa.
+    Everything else is taken from instructions, without kerning and ligatures.
+
+    """
+    rng = random.Random(seed)
+    lineCount = instructions['font']['lineCount']
+    #the glyphs are made of a few rows, so the fixture itself needs little memory
+    rowsByWidth = dict([(width, [tuple([rng.random() < 0.4 for x in xrange(width)]) for i in xrange(64)]) for width in xrange(4, 17)])
+    entries = []
+    glyphs = {}
+    for i in xrange(count):
+        if entries and rng.random() < 0.1:
+            rows = rng.choice(entries)[1]
+        else:
+            rowPool = rowsByWidth[rng.randint(4, 16)]
+            rows = [rng.choice(rowPool) for y in xrange(lineCount)]
+        glyphFile = '%05d.txt' % i
+        entries.append((glyphFile, rows))
+        glyphs[u'u%05X' % (0x20000 + i)] = glyphFile
+    fileName = 'benchmark_%d.bmfa' % count
+    glypharchive.writeArchive('%s/%s' % (settings['outputFolder'], fileName), entries)
+    vprint('wrote', count, 'benchmark glyphs to', fileName, level = 1)
+    benchmark = dict(instructions)
+    benchmark['font'] = dict(instructions['font'], folder = settings['outputFolder'], glyphFolder = fileName,
+        fileName = 'benchmark_%d' % count)
+    benchmark['glyphs'] = glyphs
+    benchmark['features'] = dict(instructions['features'], kerningClasses = {}, distances = {}, kern = [], liga = [], dlig = [])
+    return benchmark
+
+def _measureBuild(connection, instructions):
+    """Build the font of instructions and send a dict of the seconds, the peak memory in kB and mostHeldGlyphs through connection."""
+    import resource
+    try:
+        start = time.time()
+        if instructions['generator']['streamWindow']:
+            font = Font(instructions)
+        else:
+            font = fontFromFolder(instructions)
+        generator = FontforgeGenerator(instructions, font)
+        generator.build()
+        #the pools are joined, so the children are the finished pool processes
+        #and their ru_maxrss is the peak of the biggest of them, not the sum
+        connection.send({
+            'seconds' : round(time.time() - start, 3),
+            'peakMemory' : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            'peakChildMemory' : resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+            'mostHeldGlyphs' : generator.mostHeldGlyphs if instructions['generator']['streamWindow'] else len(font.glyphs),
+        })
+    except Exception, e:
+        connection.send({'error' : '{0}: {1}'.format(type(e).__name__, e)})
+    finally:
+        connection.close()
+
+def measureBuild(instructions):
+    """
+    Build the font of instructions in a new process and return the dict of _measureBuild.
+
+    The peak memory of a process only grows, each build needs its own
+    process to be measured on its own.
+
+    """
+    receiver, sender = multiprocessing.Pipe(False)
+    process = multiprocessing.Process(target = _measureBuild, args = (sender, instructions))
+    process.start()
+    sender.close()
+    try:
+        result = receiver.recv()
+    except EOFError:
+        result = {'error' : 'the build process ended with the exit code {0}'.format(process.exitcode)}
+    process.join()
+    if 'error' in result:
+        raise GeneratorError('the benchmark build failed: ' + result['error'])
+    return result
+
+def runBenchmark(instructions, count = 20000, window = 64):
+    """
+    Return a report of building benchmark fonts of count / 4 and count glyphs, once loaded at once and once streamed.
+
+    The fonts are made by writeBenchmarkFont, each is built by measureBuild.
+    The memory of a build is the peak of the main process plus the peak of
+    the biggest pool process, its growth per glyph is taken between the two
+    counts. The target font grows with every glyph in both builds, so the
+    streamed build fails only if it held more than window + 1 glyphs with
+    their lines at once or if its memory grows per glyph as much as the
+    memory of the build that loads all glyphs. The failures are in "failed".
+
+    """
+    counts = (max(1, count // 4), count)
+    builds = []
+    for glyphCount in counts:
+        data = writeBenchmarkFont(instructions, glyphCount)
+        for streamWindow in (False, window):
+            data['generator'] = dict(data['generator'], streamWindow = streamWindow)
+            result = measureBuild(data)
+            result.update(glyphs = glyphCount, streamWindow = streamWindow, memory = result['peakMemory'] + result['peakChildMemory'])
+            builds.append(result)
+            log(0, 'benchmarkBuilt', u'built {glyphs} glyphs {0} in {seconds:.3f} seconds, the peak memory was {peakMemory} kB '
+                u'in the main process and {peakChildMemory} kB in the biggest pool process', 'streamed' if streamWindow else 'loaded at once',
+                glyphs = glyphCount, seconds = result['seconds'], peakMemory = result['peakMemory'], peakChildMemory = result['peakChildMemory'])
+    growth = {}
+    for key, streamWindow in (('loaded', False), ('streamed', window)):
+        small, big = [build['memory'] for build in builds if build['streamWindow'] == streamWindow]
+        growth[key] = round(float(big - small) / max(1, counts[1] - counts[0]), 3)
+    failed = []
+    held = max([build['mostHeldGlyphs'] for build in builds if build['streamWindow']])
+    if held > window + 1:
+        failed.append('the streamed build held {0} glyphs at once, more than the window of {1} + 1'.format(held, window))
+    if counts[1] > counts[0] and growth['streamed'] >= growth['loaded']:
+        failed.append('the memory of the streamed build grows by {0} kB per glyph, not less than the {1} kB of the build that loads all glyphs'.format(
+            growth['streamed'], growth['loaded']))
+    return {'window' : window, 'builds' : builds, 'growth' : growth, 'mostHeldGlyphs' : held, 'failed' : failed}
+
+def unpackGlyphArchive(instructions, folder = None):
+    """
+    Write each entry of the glyph archive of instructions as glyph file into folder. Return the folder.
+
+    By default the folder is settings['outputFolder']/{name of the archive without extension}
+
+    """
+    font = Font(instructions)
+    fileName = '%s/%s' % (font.data['folder'], font.data['glyphFolder'])
+    if folder is None:
+        folder = '%s/%s' % (settings['outputFolder'], os.path.splitext(os.path.basename(fileName))[0])
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    filled, empty = font.data['filled'], font.data['empty']
+    with glypharchive.GlyphArchive(fileName) as archive:
+        for glyphFile in archive.names():
+            with codecs.open('%s/%s' % (folder, glyphFile), mode='w', encoding='utf-8') as file:
+                file.write(u'\n'.join([u''.join([filled if pixel else empty for pixel in row]) for row in archive.getRows(glyphFile)]))
+        vprint('unpacked', len(archive.names()), 'glyph files into', folder, level = 1)
+    return folder
+
+
+class Importer(object):
+    """
+    Import glyphs from BDF fonts or PNG sprite sheets into the BMF format.
+
+    The glyphs are normalized like the glyphs of a Font (font.lineCount,
+    font.descent, font.filled and font.empty of the instructions) and written
+    one by one into glyph files, identical glyphs share one file. After all
+    sources are imported, write() stores the "glyphs" dict and the
+    "name2Unicode" entries that are needed to keep the codepoints in a .jsn file.
+    All output goes to settings['outputFolder']/{font.fileName}_import.
+
+    """
+    def __init__(self, instructions):
+        self.font = Font(instructions)
+        self.folder = '%s/%s_import' % (settings['outputFolder'], self.font.data['fileName'])
+        self.glyphFolder = '%s/%s' % (self.folder, self.font.data['glyphFolder'])
+        if not os.path.isdir(self.glyphFolder):
+            os.makedirs(self.glyphFolder)
+        self.glyphs = {}
+        self.name2Unicode = {}
+        #sha1 of the glyph file contents : glyph file name, to share files of identical glyphs
+        self._files = {}
+        self._fileNames = set()
+
+    def importBDF(self, fileName):
+        """Import all glyphs of the BDF font fileName. Return the count of imported glyphs."""
+        count = 0
+        with open(fileName, 'rb') as file:
+            for glyph in importers.readBDF(file):
+                width, height, xOffset, yOffset = glyph['box']
+                #the glyph is as wide as its advance, so it needs no distances, ink outside of that widens it
+                left = min(0, xOffset)
+                right = max(glyph['advance'], xOffset + width)
+                #the top row of the bitmap in the lines of the glyph
+                top = self.font.data['lineCount'] - self.font.data['descent'] - (yOffset + height)
+                matrix = [[False] * (right - left) for i in xrange(self.font.data['lineCount'])]
+                for y, row in enumerate(glyph['rows']):
+                    if not 0 <= top + y < len(matrix): continue
+                    for x, pixel in enumerate(row):
+                        matrix[top + y][xOffset - left + x] = pixel
+                encoding = glyph['encoding'] if glyph['encoding'] >= 0 else None
+                self.addGlyph(glyph['name'], encoding, matrix)
+                count += 1
+        vprint('imported', count, 'glyphs from', fileName, level = 1)
+        return count
+
+    def importSheet(self, fileName, grid):
+        """
+        Import the glyphs of the PNG sprite sheet fileName, sliced as described by grid. Return the count of imported glyphs.
+
+        Besides the keys of importers.sliceSheet, grid may have:
+            baseline: the count of pixel rows from the top of a cell to the baseline [default: cellHeight - font.descent]
+            characters: a string with the character of each cell
+            first: the codepoint of the first cell if there are no characters, the following cells count up [default: 32]
+            trim: cut empty columns on the left and right side of each glyph [default: False]
+        Empty cells are skipped, unless their character is whitespace.
+
+        """
+        baseline = grid.get('baseline', grid['cellHeight'] - self.font.data['descent'])
+        top = self.font.data['lineCount'] - self.font.data['descent'] - baseline
+        characters = grid.get('characters', None)
+        first = grid.get('first', 32)
+        count = 0
+        with open(fileName, 'rb') as file:
+            width, height, rows = importers.readPNG(file)
+            for index, cell in importers.sliceSheet(width, height, rows, grid):
+                if characters is not None:
+                    if index >= len(characters): break
+                    char = characters[index]
+                else:
+                    char = unichr(first + index)
+                if True not in [True in row for row in cell] and not char.isspace(): continue
+                if grid.get('trim', False):
+                    columns = [x for x in xrange(grid['cellWidth']) if True in [row[x] for row in cell]]
+                    if columns:
+                        cell = [row[columns[0]:columns[-1] + 1] for row in cell]
+                matrix = [[False] * len(cell[0]) for i in xrange(self.font.data['lineCount'])]
+                for y, row in enumerate(cell):
+                    if 0 <= top + y < len(matrix):
+                        matrix[top + y] = row
+                self.addGlyph(char, ord(char), matrix)
+                count += 1
+        vprint('imported', count, 'glyphs from', fileName, level = 1)
+        return count
+
+    def addGlyph(self, rawName, encoding, matrix):
+        """Name the glyph using the UnicodeAndNames of the font and write its glyph file."""
+        names = self.font.names
+        if encoding is None:
+            name = names.getName(rawName)
+        else:
+            unicde, name = names.getUnicodeAndName(rawName)
+            if unicde != encoding and len(rawName) > 1:
+                #rawName is a name, but not one for encoding, so remember the codepoint for it
+                name = str(rawName)
+                self.name2Unicode[name] = unichr(encoding)
+            elif unicde != encoding:
+                name = names.getName(unichr(encoding))
+        if name in self.glyphs:
+            log(2, 'glyphOverwritten', u'overwriting: {rawName} ({glyph}) it was imported before.', rawName = rawName, glyph = name)
+        filled, empty = self.font.data['filled'], self.font.data['empty']
+        content = u''.join([u''.join([filled if pixel else empty for pixel in row]) + u'\n' for row in matrix])
+        key = hashlib.sha1(content.encode('utf-8')).digest()
+        if key not in self._files:
+            self._files[key] = self._getFileName(name)
+            with codecs.open('%s/%s' % (self.glyphFolder, self._files[key]), mode='w', encoding='utf-8') as file:
+                file.write(content)
+        self.glyphs[name] = self._files[key]
+        log(3, 'glyphImported', u'imported Glyph: {rawName} as: {glyph} in {file}', rawName = rawName, glyph = name, file = self._files[key])
+
+    def _getFileName(self, name):
+        """Return a new glyph file name for name that is unique even on case insensitive filesystems. "A" will become "aCap.txt"."""
+        base = re.sub(r'([A-Z])', lambda match: match.group(1).lower() + 'Cap', name[0]) + name[1:]
+        base = re.sub(r'[^A-Za-z0-9_.-]', '_', base)
+        fileName = base + '.txt'
+        i = 1
+        while fileName.lower() in self._fileNames:
+            fileName = '%s_%d.txt' % (base, i)
+            i += 1
+        self._fileNames.add(fileName.lower())
+        return fileName
+
+    def write(self):
+        """Write the glyphs dict and name2Unicode to glyphs.jsn in the import folder."""
+        fileName = '%s/glyphs.jsn' % (self.folder,)
+        writeJson(fileName, {'glyphs' : self.glyphs, 'name2Unicode' : self.name2Unicode})
+        vprint(len(self.glyphs), 'glyphs in', len(self._files), 'files', level = 1)
+        return fileName
 
 
 class Generator(object):
@@ -441,6 +1284,7 @@ class Generator(object):
 
     def __init__(self, instructions, font):
         self.font = font
+        self.data = dict(self.data)
         self.data.update(instructions['generator'])
         self.instructions = instructions
         pass
@@ -449,6 +1293,22 @@ class Generator(object):
         """The generate function is called to run the Generator after it has been set up."""
         raise GeneratorError('a Generator must define a method called generate')
 
+    def getVerticalMetrics(self):
+        """Return a dict of the em, ascent, descent, upos (underline position) and uwidth (underline height) of the font in em units."""
+        if self.data['emDescent']:
+            descent = int(self.data['emDescent'])
+            vprint ('descent, using generator.emDescent:', descent, level = 2)
+        else:
+            descent = self.font.data['descent'] * self.data['unit']
+            vprint ('descent, calculated from font.descent * generator.unit:', descent, level = 2)
+        return {
+            'em' : self.data['em'],
+            'ascent' : self.data['em'] - descent,
+            'descent' : descent,
+            'upos' : self.font.data['upos'] * self.data['unit'] + self.data['offset'],
+            'uwidth' : self.font.data['uwidth'] * self.data['unit'] - (2 * self.data['offset']),
+        }
+
     def __call__(self):
         self.generate()
 
@@ -456,6 +1316,8 @@ class Generator(object):
 class KerningClassesGenerator(Generator):
     """Generate qlyph classes for kerning by using a hash of the glyphs edges."""
     words = {}
+    #className : {'representative' : glyph name, 'glyphs' : {glyph name : distance}} of the last build with a tolerance or limit
+    deviations = {}
     _leftEdge = 1
     _rightEdge = 1
 
@@ -487,6 +1349,9 @@ class KerningClassesGenerator(Generator):
         result = self.build()
         fileName =  '%s/%s_L%d_R%d_%s' % (settings['outputFolder'], self.font.data['fileName'], self.leftEdge, self.rightEdge, self.data['generatedClassesFile'])
         writeJson(fileName, {'features' : { 'kerningClasses': result }});
+        if self.isClustering() and self.data['classDeviationsFile']:
+            fileName =  '%s/%s_L%d_R%d_%s' % (settings['outputFolder'], self.font.data['fileName'], self.leftEdge, self.rightEdge, self.data['classDeviationsFile'])
+            writeJson(fileName, self.deviations)
 
     def getEdges(self):
         edges = []
@@ -507,12 +1372,113 @@ class KerningClassesGenerator(Generator):
                 else:
                    classes[side][edge] = [data['rawName']]
         result = {}
+        self.deviations = {}
         for (side, width) in edges:
             vprint(len(classes[side]), 'classes for ', side, 'edge at width', width, level = 2)
-            for edge, chars in classes[side].iteritems():
-                result[self._getNameForEdge(side, edge, chars)] = u' '.join(chars);
+            if not self.isClustering():
+                for edge, chars in classes[side].iteritems():
+                    result[self._getNameForEdge(side, edge, chars)] = u' '.join(chars);
+                continue
+            clusters = self.clusterEdges(side, classes[side])
+            vprint(len(clusters), 'classes for ', side, 'edge at width', width, 'with a tolerance of',
+                self.data['classTolerance'], level = 2)
+            for representative, members in clusters.iteritems():
+                chars = [char for edge in members for char in classes[side][edge]]
+                className = self._getNameForEdge(side, representative, chars)
+                result[className] = u' '.join(chars);
+                key = self._getEdgeKey(side, representative)
+                self.deviations[className] = {
+                    'representative' : classes[side][representative][0],
+                    'glyphs' : dict([(char, self._getEdgeDistance(key, self._getEdgeKey(side, edge)))
+                        for edge in members for char in classes[side][edge]])
+                }
         return result
 
+    def isClustering(self):
+        """Return True if the classes are made with a tolerance or a limit."""
+        return self.data['classTolerance'] > 0 or bool(self.data['classLimit'])
+
+    def clusterEdges(self, side, classes):
+        """
+        Return a dict of representative edge : list of the edges in its class.
+
+        classes is a dict of edge : glyph names. The edges with the most
+        glyphs become representatives first, each other edge joins the
+        nearest representative within classTolerance. If there are more
+        than classLimit classes, the classes with the fewest glyphs are
+        given up and their edges join the nearest remaining representative.
+        Only edges of the same size are compared.
+
+        """
+        tolerance = self.data['classTolerance']
+        limit = self.data['classLimit']
+        keys = dict([(edge, self._getEdgeKey(side, edge)) for edge in classes])
+        order = sorted(classes, key = lambda edge: (-len(classes[edge]), edge))
+        clusters = {}
+        for edge in order:
+            representative, distance = self._getNearest(keys, edge, clusters)
+            if representative is None or distance > tolerance:
+                clusters[edge] = [edge]
+            else:
+                clusters[representative].append(edge)
+        if not limit or len(clusters) <= limit:
+            return clusters
+        bySize = sorted(clusters, key = lambda edge: (-sum([len(classes[member]) for member in clusters[edge]]), edge))
+        kept = dict([(edge, []) for edge in bySize[:limit]])
+        for representative in bySize[limit:]:
+            #an edge of a size no kept representative has can't join any
+            if self._getNearest(keys, representative, kept)[0] is None:
+                kept[representative] = []
+        for edge in order:
+            kept[self._getNearest(keys, edge, kept)[0]].append(edge)
+        if len(kept) > limit:
+            vprint('the limit of', limit, 'classes for', side, 'edges is exceeded by edges of other sizes', level = 1)
+        return kept
+
+    def _getNearest(self, keys, edge, representatives):
+        """Return a tuple (representative, distance) of the nearest edge of the same size in representatives, (None, None) if there is none."""
+        size = keys[edge][0]
+        nearest = (None, None)
+        for representative in representatives:
+            if keys[representative][0] != size: continue
+            distance = self._getEdgeDistance(keys[edge], keys[representative])
+            if nearest[1] is None or distance < nearest[1]:
+                nearest = (representative, distance)
+                if distance == 0: break
+        return nearest
+
+    def _getEdgeKey(self, side, edge):
+        """
+        Return a tuple (size, key) of edge to measure distances with _getEdgeDistance.
+
+        size is (count of lines, width), key is a bit mask of the filled raster units
+        for "hamming" or the profile of the edge, the empty raster units between
+        the outside of the edge and the ink in each line, for "profile".
+
+        """
+        filled = self.font.data['filled']
+        size = (len(edge), len(edge[0]))
+        if self.data['classDistance'] == 'profile':
+            profile = []
+            for line in edge:
+                if side == 'right':
+                    line = line[::-1]
+                profile.append(line.index(filled) if filled in line else len(line))
+            return (size, tuple(profile))
+        if self.data['classDistance'] != 'hamming':
+            raise OptionsError('classDistance must be either "hamming" or "profile"')
+        mask = 0
+        for line in edge:
+            for char in line:
+                mask = (mask << 1) | (char == filled)
+        return (size, mask)
+
+    def _getEdgeDistance(self, a, b):
+        """Return the distance between the keys a and b of two edges of the same size."""
+        if self.data['classDistance'] == 'profile':
+            return max([abs(x - y) for x, y in zip(a[1], b[1])] + [0])
+        return bin(a[1] ^ b[1]).count('1')
+
     def _getEdge(self, data, side, width):
         """Return a tuple representing the edge of glyph."""
         if side not in ('left', 'right'):
@@ -683,7 +1649,8 @@ class DistancesGenerator(Generator):
                 actionIndex += 2
                 self.font.features['kern'].append(pair)
             actionCount[actionIndex] += 1
-            vprint (actionVerbs[actionIndex], u', '.join(map(unicode, pair)), 'old value was', changeVal - pair[2], level = 3)
+            log(3, 'pairAltered', u'{0} {pair[0]}, {pair[1]}, {pair[2]} old value was {old}', actionVerbs[actionIndex],
+                pair = pair[:3], old = pair[2] - changeVal)
         for verb, count in zip(actionVerbs, actionCount):
             vprint ('%s: %d' % (verb, count), level = 2)
         #remember this change in the distances table!
@@ -700,140 +1667,455 @@ class DistancesGenerator(Generator):
         return True;
 
 
-class FontforgeGenerator(Generator):
-    """makes a fontforge font (or anything fontforge can generate) from a font"""
-    _drawOptions = None
+class KerningMergeGenerator(Generator):
+    """
+    Merge kerning classes that kern the same with all partners and have the same distance.
 
-    def __init__(self,  instructions, font):
-        super(FontforgeGenerator, self).__init__(instructions, font)
-        self.target = fontforge.font()
-        self.target.em = self.data['em']
-        self._setup()
-        self._setupMetadata()
+    First classes (classRightIndicator) are merged if their rows in the kern
+    table are the same, second classes (classLeftIndicator) if their columns
+    are. The merged class has the name of the first of the merged classes in
+    sorted order. kerningClasses, kern and distances are rewritten together,
+    so the font looks the same, but the class matrix made by
+    FontforgeGenerator.addKerning gets smaller.
 
-    def _setup(self):
-        """set up the fontforge font"""
-        #initial setting
-        font = self.font
-        #seems like there has to be at least one char in the font for the setup
-        stub = self.target.createChar(-1, '_stub')
-        if self.data['emDescent']:
-            descent = int(self.data['emDescent'])
-            vprint ('descent, using generator.emDescent:', descent, level = 2)
-        else:
-            descent = font.data['descent'] * self.data['unit']
-            vprint ('descent, calculated from font.descent * generator.unit:', descent, level = 2)
-        self.target.ascent = self.data['em'] - descent
-        self.target.descent = descent
-        self.target.upos = font.data['upos'] * self.data['unit'] + self.data['offset']
-        self.target.uwidth = font.data['uwidth'] * self.data['unit'] - (2 * self.data['offset'])
-        fontFolder = font.data['folder']
-        if  font.data['featureFile']:
-            self.target.mergeFeature(u'%s/%s' % (fontFolder, font.data['featureFile']))
-            vprint('merged featureFile: %s' % (font.data['featureFile'],), level = 2)
-        self.target.removeGlyph(stub)
+    """
+    def generate(self):
+        result = self.merge()
+        fileName =  '%s/%s_%s' % (settings['outputFolder'], self.font.data['fileName'], self.data['generatedMergedKerningFile'])
+        writeJson(fileName, {'features' : result});
 
-    @staticmethod
-    def _getFeatureScriptLangTuple(featureTag, languageSystems):
-        """obscure thing that"""
-        return ((
-            featureTag,
-            tuple([(script, (lang,),) for script, lang in languageSystems])
-            ),)
+    def merge(self):
+        """Return a dict of the merged kerningClasses, kern and distances, the features of the font are not changed."""
+        classes = dict(self.font.features['kerningClasses'])
+        kern = [list(pair) for pair in self.font.features['kern']]
+        distances = dict(self.font.features['distances'])
+        for side, indicator in enumerate((self.font.data['classRightIndicator'], self.font.data['classLeftIndicator'])):
+            before = len([name for name in classes if name.startswith(indicator)])
+            groups = self.getEquivalentClasses(side, indicator, classes, kern, distances)
+            merged = set()
+            for names in groups:
+                members = []
+                seen = set()
+                for name in names:
+                    for member in classes.pop(name).split(' '):
+                        if member in seen: continue
+                        seen.add(member)
+                        members.append(member)
+                classes[names[0]] = u' '.join(members)
+                for name in names[1:]:
+                    distances.pop(name, None)
+                    merged.add(name)
+                if isLogged(3):
+                    log(3, 'classesMerged', u'merged {0} into {klass}', u', '.join(names), classes = names, klass = names[0])
+            kern = [pair for pair in kern if pair[side] not in merged]
+            vprint('merged', before, 'classes', indicator, 'into', before - len(merged), level = 1)
+        vprint('the kern table has', len(kern), 'of', len(self.font.features['kern']), 'pairs', level = 1)
+        return {
+            'distances' : distances,
+            'kern' : kern,
+            'kerningClasses' : classes,
+        }
 
-    def addLigatures(self):
-        """adding ligatures it is best when the glyphs in the font are already build, right?"""
-        for featureTag in ('liga', 'dlig', 'hlig', 'ccmp'):
-            if featureTag not in self.font.features or len(self.font.features[featureTag]) < 1: continue
-            lookupName = '{0}Ligatures'.format(featureTag)
-            subtableName = '{0}Sub 0'.format(lookupName)
-            self.target.addLookup(
-                lookupName,
-                'gsub_ligature',
-                (),
-                self._getFeatureScriptLangTuple(featureTag, self.font.features['languagesystems'])
-            )
-            self.target.addLookupSubtable(lookupName, subtableName)
-            for sub, by in self.font.features[featureTag]:
-                glyphName = self.font.names.getName(by)
-                if glyphName not in self.target:
-                    glyph = self.target.createChar(*self.font.names.getUnicodeAndName(by))
-                    vprint('created', glyphName, '({0})'.format(by),'which is said beeing a ligature for', sub, 'but didn\'t exist until now.', level = 2)
-                else:
-                    glyph = self.target[glyphName]
-                glyph.addPosSub(subtableName, map(self.font.names.nameGetter, sub.split(' ')))
+    def getEquivalentClasses(self, side, indicator, classes, kern, distances):
+        """
+        Return a sorted list of the sorted groups of classes starting with indicator, that can be merged.
 
-    def addKerning(self):
-        featureTag = 'kern'
-        lookupName = '{0}Kerning'.format(featureTag)
-        subtableName = '{0}Sub 0'.format(lookupName)
-        self.target.addLookup(
-            lookupName,
-            'gpos_pair',
-            (),
-            self._getFeatureScriptLangTuple(featureTag, self.font.features['languagesystems'])
-        )
-        firstClasses = tuple(filter(lambda x: x.startswith(self.font.data['classRightIndicator']), self.font.classes.keys()))
-        secondClasses = tuple(filter(lambda x: x.startswith(self.font.data['classLeftIndicator']), self.font.classes.keys()))
-        pairs = {}
-        for pair in self.font.features['kern']:
-            pairs[(pair[0], pair[1])] = pair[2]
-        #The offsets argument is a tuple of kerning offsets. There must be as many entries as len(first-class)*len(second-class).
-        offsets = []
-        for f in firstClasses:
-            for s in secondClasses:
-                offsets.append(self.data['unit'] * pairs.get((f,s),0))
-        self.target.addKerningClass(\
-            lookupName,\
-            subtableName,\
-            [self.font.classes[k] for k in firstClasses],\
-            [self.font.classes[k] for k in secondClasses],\
-            offsets)
+        side is the index of these classes in the entries of kern, 0 for first
+        classes and 1 for second classes. The classes of a group have the same
+        distance and the same entries in kern with the same partners.
 
-    def _setupMetadata(self):
-        metadata = self.instructions['metadata']
-        target = self.target
-        target.fontname = metadata['fontname']
-        target.weight = metadata['weight']
-        target.fullname = metadata['fullname']
-        target.familyname = metadata['familyname']
-        target.copyright = metadata['copyright']
-        target.version = metadata['version']
-        target.comment = metadata['comment']
-        for language, data in metadata['more'].iteritems():
-            for strid, string in data.iteritems():
-                try:
-                    target.appendSFNTName(settings['sfntLookup'].get(language, language), settings['sfntLookup'].get(strid, strid), string)
-                except TypeError, e:
-                    vprint ('some metadata has not been set:', language, strid, 'Message:', e)
+        """
+        partners = {}#class : {partner : (value, anything beyond the standards in this entry)}
+        for pair in kern:
+            if pair[side] not in classes or (pair[2] == 0 and len(pair) < 4): continue
+            partners.setdefault(pair[side], {})[pair[1 - side]] = tuple(pair[2:])
+        groups = {}
+        for name in classes:
+            if not name.startswith(indicator): continue
+            key = (distances.get(name, 0), tuple(sorted(partners.get(name, {}).iteritems())))
+            groups.setdefault(key, []).append(name)
+        return sorted([sorted(names) for names in groups.itervalues() if len(names) > 1])
+
+
+class AutoKerningGenerator(Generator):
+    """
+    Make the kern table from the space between the ink of the glyphs and the edges of their kerning classes.
 
-    def build(self):
-        for name, data in self.font.glyphs.iteritems():
-            self.makeChar(name, data)
-        self.addLigatures()
-        self.addKerning()
+    For each line the profile of a first class (classRightIndicator) is the
+    count of empty raster units between the ink and the right edge, plus the
+    right distance, for a second class (classLeftIndicator) the same on the
+    left. The profile of a class is the smallest of its glyphs in each line.
+    The gap of a pair in a line is the sum of both profiles, the kerning
+    brings the narrowest gap to generator.autoKernGap, without letting the
+    gap to the diagonally adjacent lines get narrower than generator.autoKernMinGap.
 
-    def generate(self):
-        self.build();
-        for fileExtexsion in self.data['fileFormats']:
-            fileName = '%s/%s.%s' % (settings['outputFolder'] , self.font.data['fileName'], fileExtexsion)
-            if fileExtexsion is 'sfd':
-                self.target.save(fileName)
-            else:
-                self.target.generate(fileName, flags = self.data['ffGenerateFlags'])
-            vprint('wrote a .%s-file: %s' % (fileExtexsion, fileName), level = 1)
+    All second profiles are compared with a first profile at once: for each
+    line and value there is a bit mask of the second profiles with at most
+    that value in the line, so the pairs with a gap of at most n are an OR
+    of one mask per line. That way thousands of classes take seconds.
 
-    def isFilled(self, val):
-        return (val == self.font.data['filled'])
+    """
+    #the profile of a line without ink
+    noInk = 1 << 30
 
-    def getChoord(self, matrix, y, x):
-        """Return True if the field at (y, x) is filled, or return False"""
-        if y < 0 or x < 0:
-            return False
-        try:
-            return self.isFilled(matrix[y][x])
-        except IndexError, e:
-            return False
+    def generate(self):
+        result = self.build()
+        fileName =  '%s/%s_%s' % (settings['outputFolder'], self.font.data['fileName'], self.data['generatedAutoKerningFile'])
+        writeJson(fileName, {'features' : { 'kern': result }});
+
+    def build(self):
+        """Return a list of the [first, second, value] kerning pairs sorted by first and second."""
+        start = time.time()
+        firsts = self.getProfiles(self.font.data['classRightIndicator'], 'right')
+        seconds = self.getProfiles(self.font.data['classLeftIndicator'], 'left')
+        secondProfiles = sorted(seconds)
+        masks = self._getMasks(secondProfiles)
+        #the value is max(gap - narrowest, minGap - narrowest, minGap - narrowest to the adjacent lines)
+        gap = max(self.data['autoKernGap'], self.data['autoKernMinGap'])
+        minGap = self.data['autoKernMinGap']
+        limit = self.data['autoKernLimit']
+        kern = []
+        for first in sorted(firsts):
+            neighbours = self._getNeighbours(first)
+            #the second profiles with a value of at least k
+            atLeast = {}
+            for k in xrange(-limit + 1, limit + 1):
+                atLeast[k] = self._narrowest(masks, first, gap - k) | self._narrowest(masks, neighbours, minGap - k)
+            #pairs without a line with ink in both are not kerned
+            atLeast[-limit] = self._narrowest(masks, first, self.noInk - 1)
+            atLeast[limit + 1] = 0
+            values = []
+            for k in xrange(-limit, limit + 1):
+                if k == 0: continue
+                mask = atLeast[k] & ~atLeast[k + 1]
+                while mask:
+                    bit = mask & -mask
+                    values.append((secondProfiles[bit.bit_length() - 1], k))
+                    mask ^= bit
+            for firstClass in firsts[first]:
+                for second, value in values:
+                    for secondClass in seconds[second]:
+                        kern.append([firstClass, secondClass, value])
+        kern.sort()
+        vprint(len(kern), 'kerning pairs for', len(firsts), 'by', len(seconds), 'distinct profiles',
+            'in %.3f seconds' % (time.time() - start), level = 1)
+        return kern
+
+    @staticmethod
+    def _getMasks(profiles):
+        """
+        Return for each line a tuple (values, masks) of the sorted values in the line
+        and for each value a bit mask of the profiles with at most that value.
+        Bit i stands for profiles[i].
+
+        """
+        lines = []
+        for y in xrange(len(profiles[0]) if profiles else 0):
+            byValue = {}
+            for i, profile in enumerate(profiles):
+                byValue[profile[y]] = byValue.get(profile[y], 0) | (1 << i)
+            values = sorted(byValue)
+            masks = []
+            mask = 0
+            for value in values:
+                mask |= byValue[value]
+                masks.append(mask)
+            lines.append((values, masks))
+        return lines
+
+    def _narrowest(self, masks, profile, most):
+        """Return a bit mask of the profiles of masks with a gap of at most most to profile in any line."""
+        result = 0
+        for (values, lineMasks), own in zip(masks, profile):
+            if own >= self.noInk: continue
+            index = bisect.bisect_right(values, most - own) - 1
+            if index >= 0:
+                result |= lineMasks[index]
+        return result
+
+    def _getNeighbours(self, profile):
+        """Return for each line the smaller profile of the lines above and below."""
+        padded = (self.noInk,) + profile + (self.noInk,)
+        return tuple([min(padded[y], padded[y + 2]) for y in xrange(len(profile))])
+
+    def getProfiles(self, indicator, side):
+        """Return a dict of profile : names of the classes starting with indicator, side is the edge of the glyphs the profile is measured at."""
+        profiles = {}
+        for className, members in self.font.classes.iteritems():
+            if not className.startswith(indicator): continue
+            profile = None
+            for name in members:
+                if name not in self.font.glyphs: continue
+                glyphProfile = self.getGlyphProfile(name, side)
+                profile = glyphProfile if profile is None else tuple(map(min, profile, glyphProfile))
+            if profile is not None:
+                profiles.setdefault(profile, []).append(className)
+        return profiles
+
+    def getGlyphProfile(self, name, side):
+        """Return a tuple of the empty raster units between the ink and the edge (with distance) of the glyph for each line."""
+        data = self.font.glyphs[name]
+        dist = self.font.getDistances(name)
+        filled = self.font.data['filled']
+        profile = []
+        for line in data['lines']:
+            if filled not in line:
+                profile.append(self.noInk)
+            elif side == 'left':
+                profile.append(line.index(filled) + dist[0])
+            else:
+                profile.append(data['width'] - 1 - line.rindex(filled) + dist[1])
+        return tuple(profile)
+
+
+class DryRunGenerator(Generator):
+    """
+    Compute the metrics the FontforgeGenerator would produce, without fontforge and without drawing outlines.
+
+    The report has the vertical metrics, for each glyph the advance width
+    and the bounds of its filled pixels in em units, the bounds of the
+    font, statistics of the kern table and what kerning can't resolve:
+    pairs of unknown classes, class members that are no glyphs and glyphs
+    that are in no first or second class.
+
+    """
+    def generate(self):
+        result = self.build()
+        fileName =  '%s/%s_%s' % (settings['outputFolder'], self.font.data['fileName'], self.data['generatedDryRunFile'])
+        writeJson(fileName, result)
+
+    def build(self):
+        start = time.time()
+        glyphs = {}
+        bounds = None
+        for name in self.font.glyphs:
+            glyphs[name] = self.getGlyphMetrics(name)
+            box = glyphs[name]['bounds']
+            if box is None: continue
+            bounds = box if bounds is None else [min(bounds[0], box[0]), min(bounds[1], box[1]), max(bounds[2], box[2]), max(bounds[3], box[3])]
+        result = {
+            'vertical' : self.getVerticalMetrics(),
+            'bounds' : bounds,
+            'glyphs' : glyphs,
+            'kerning' : self.getKerningMetrics(),
+        }
+        for name, metrics in sorted(glyphs.iteritems()):
+            if metrics['advance'] <= 0:
+                vprint('glyph', name, 'has an advance width of', metrics['advance'], level = 0)
+        kerning = result['kerning']
+        vprint(len(glyphs), 'glyphs, bounds', bounds, kerning['pairs'], 'kerning pairs in a matrix of',
+            kerning['firstClasses'], 'by', kerning['secondClasses'], 'classes', level = 1)
+        for key in ('unknownClasses', 'unknownMembers', 'withoutFirstClass', 'withoutSecondClass'):
+            if kerning[key]:
+                vprint(len(kerning[key]), key, u', '.join(kerning[key]), level = 1)
+        vprint('dry run in %.3f seconds' % (time.time() - start), level = 1)
+        return result
+
+    def getGlyphMetrics(self, name):
+        """
+        Return a dict of the advance width and the bounds of the filled pixels of the glyph with name.
+
+        The bounds are [xMin, yMin, xMax, yMax] in em units as drawn by
+        FontforgeGenerator.drawFilled or None if the glyph has no filled pixels.
+
+        """
+        data = self.font.glyphs[name]
+        dist = self.font.getDistances(name)
+        unit = self.data['unit']
+        offset = self.data['offset']
+        ink = self.font.getInk(name)
+        bounds = None
+        if ink:
+            lines = len(data['lines'])
+            descent = self.font.data['descent']
+            left = min([x for x, y in ink])
+            right = max([x for x, y in ink])
+            #lines go down, em units go up
+            top = lines - 1 - min([y for x, y in ink]) - descent
+            bottom = lines - 1 - max([y for x, y in ink]) - descent
+            bounds = [
+                left * unit + offset,
+                bottom * unit + offset,
+                right * unit + offset + self.data['width'],
+                top * unit + offset + self.data['width'],
+            ]
+        return {
+            'advance' : (data['width'] + sum(dist)) * unit,
+            'bounds' : bounds,
+            'distances' : list(dist),
+        }
+
+    def getKerningMetrics(self):
+        """Return a dict of statistics of the kern table and of what it can't resolve."""
+        classes = self.font.features['kerningClasses']
+        firsts = [name for name in classes if name.startswith(self.font.data['classRightIndicator'])]
+        seconds = [name for name in classes if name.startswith(self.font.data['classLeftIndicator'])]
+        values = [pair[2] for pair in self.font.features['kern']]
+        unknownClasses = set()
+        for pair in self.font.features['kern']:
+            unknownClasses.update([klass for klass in pair[:2] if klass not in classes])
+        unknownMembers = set()
+        for members in self.font.classes.itervalues():
+            unknownMembers.update([name for name in members if name not in self.font.glyphs])
+        inFirsts = set([name for klass in firsts for name in self.font.classes[klass]])
+        inSeconds = set([name for klass in seconds for name in self.font.classes[klass]])
+        return {
+            'pairs' : len(values),
+            'firstClasses' : len(firsts),
+            'secondClasses' : len(seconds),
+            #share of the class matrix of the kern feature that has a value
+            'density' : round(float(len(values)) / (len(firsts) * len(seconds)), 4) if firsts and seconds else 0,
+            'min' : min(values) if values else 0,
+            'max' : max(values) if values else 0,
+            'unknownClasses' : sorted(unknownClasses),
+            'unknownMembers' : sorted(unknownMembers),
+            'withoutFirstClass' : sorted([name for name in self.font.glyphs if name not in inFirsts]),
+            'withoutSecondClass' : sorted([name for name in self.font.glyphs if name not in inSeconds]),
+        }
+
+
+class FeatureFileGenerator(Generator):
+    """
+    Write the kerning classes, kern, liga, dlig, hlig and ccmp of a font as one .fea file, without fontforge.
+
+    The file is named by a digest of its content and generator.generatedFeatureFile,
+    fonts with the same features (e.g. the weights of a family) share one
+    file, that is written once and reused by all later builds.
+    Members of classes and ligatures that are no glyphs of the font are left out.
+
+    """
+    #changes when render writes something else for the same data, so old files are not reused
+    formatVersion = 1
+
+    def generate(self):
+        return self.build()
+
+    def build(self):
+        """Return the file name of the feature file, write it if it doesn't exist yet."""
+        languagesystems = [tuple(system) for system in self.font.features['languagesystems']]
+        substitutions = self.getSubstitutions()
+        known = set(self.font.glyphs)
+        known.update([by for featureTag, ligatures in substitutions for sub, by in ligatures])
+        classes, kern = self.getKerning(known)
+        data = [self.formatVersion, languagesystems, classes, kern, substitutions]
+        digest = hashlib.sha1(json.dumps(data, sort_keys = True)).hexdigest()[:16]
+        fileName = '%s/%s_%s' % (settings['outputFolder'], digest, self.data['generatedFeatureFile'] or 'features.fea')
+        if os.path.exists(fileName):
+            vprint('reusing the feature file', fileName, level = 2)
+            return fileName
+        feafile.writeFeatureFile(fileName, feafile.render(languagesystems, classes, kern, substitutions))
+        vprint('wrote the feature file', fileName, 'with', len(classes), 'classes', len(kern), 'kerning pairs and',
+            sum([len(ligatures) for featureTag, ligatures in substitutions]), 'ligatures', level = 1)
+        return fileName
+
+    def getSubstitutions(self):
+        """Return a list of (feature tag, list of (component names, ligature name)) of the ligature features."""
+        result = []
+        for featureTag in ('liga', 'dlig', 'hlig', 'ccmp'):
+            ligatures = []
+            for sub, by in self.font.features.get(featureTag, []):
+                components = map(self.font.names.nameGetter, sub.split(' '))
+                missing = [name for name in components if name not in self.font.glyphs]
+                if missing:
+                    log(2, 'ligatureLeftOut', u'left out the {feature} ligature {sub} its components {missing} are no glyphs',
+                        feature = featureTag, sub = sub, missing = missing)
+                    continue
+                ligatures.append((components, self.font.names.getName(by)))
+            result.append((featureTag, ligatures))
+        return result
+
+    def getKerning(self, known):
+        """
+        Return a tuple (classes, kern) of the sorted kerning classes (class name, glyph names)
+        and the pairs of the kern feature (first class, second class, value in em units) that are not 0.
+
+        """
+        firstIndicator = self.font.data['classRightIndicator']
+        secondIndicator = self.font.data['classLeftIndicator']
+        classes = []
+        for className, members in sorted(self.font.classes.iteritems()):
+            if not className.startswith((firstIndicator, secondIndicator)): continue
+            members = [name for name in members if name in known]
+            if members:
+                classes.append((className, members))
+        classNames = set([className for className, members in classes])
+        pairs = {}
+        for pair in self.font.features['kern']:
+            pairs[(pair[0], pair[1])] = pair[2]
+        kern = []
+        for (first, second), value in sorted(pairs.iteritems()):
+            if not value or first not in classNames or second not in classNames: continue
+            if not first.startswith(firstIndicator) or not second.startswith(secondIndicator): continue
+            kern.append((first, second, self.data['unit'] * value))
+        return (classes, kern)
+
+
+class BitmapGenerator(Generator):
+    """
+    Write native bitmap fonts (BDF, PCF, PSF2) directly from the glyph data, no outlines are made.
+
+    The formats are set by generator.bitmapFormats, the size by generator.bitmapScale.
+
+    """
+    def getInfo(self):
+        """Return the font wide information of the bitmap font in pixels."""
+        scale = self.data['bitmapScale']
+        lineCount = self.font.data['lineCount']
+        descent = self.font.data['descent']
+        metadata = self.instructions['metadata']
+        return {
+            'fontname' : metadata['fontname'],
+            'familyname' : metadata['familyname'],
+            'weight' : metadata['weight'],
+            'copyright' : metadata['copyright'],
+            'pixelSize' : lineCount * scale,
+            'ascent' : (lineCount - descent) * scale,
+            'descent' : descent * scale,
+        }
+
+    def getGlyphs(self):
+        """Return a list of the glyphs as needed by the writers in bitmapformats, sorted by unicode."""
+        glyphs = []
+        for name in self.font.glyphs:
+            (unicde, glyphName) = self.font.names.getUnicodeAndName(name)
+            metrics, rows = self.font.getBitmap(name, self.data['bitmapScale'])
+            glyphs.append({'name' : glyphName, 'unicode' : unicde, 'metrics' : metrics, 'rows' : rows})
+        glyphs.sort(key = lambda glyph: glyph['unicode'])
+        return glyphs
+
+    def generate(self):
+        info = self.getInfo()
+        glyphs = self.getGlyphs()
+        for fileExtexsion in self.data['bitmapFormats']:
+            if fileExtexsion not in bitmapformats.bitmapFormats:
+                raise GeneratorError('{0} is not a bitmap format, use any of: {1}'.format(fileExtexsion, ', '.join(bitmapformats.bitmapFormats)))
+            fileName = '%s/%s.%s' % (settings['outputFolder'] , self.font.data['fileName'], fileExtexsion)
+            with open(fileName, 'wb') as file:
+                file.write(bitmapformats.buildBitmapFont(fileExtexsion, info, glyphs))
+            log(1, 'fileWritten', u'wrote a .{format}-file: {file}', format = fileExtexsion, file = fileName)
+
+
+class OutlineGenerator(Generator):
+    """
+    The base of the generators that draw the pixel shapes of the glyphs with a pen.
+
+    A pen has the methods moveTo(point), lineTo(point), curveTo(*points) and
+    closePath(), like the glyphPen of fontforge. Nothing here needs fontforge.
+
+    """
+    _drawOptions = None
+
+    def isFilled(self, val):
+        return (val == self.font.data['filled'])
+
+    def getChoord(self, matrix, y, x):
+        """Return True if the field at (y, x) is filled, or return False"""
+        if y < 0 or x < 0:
+            return False
+        try:
+            return self.isFilled(matrix[y][x])
+        except IndexError, e:
+            return False
 
     def getInnerContextualCorners(self, matrix, y, x):
         """
@@ -905,33 +2187,22 @@ class FontforgeGenerator(Generator):
         SE = (env[3] and env[4] and env[5])
         return (SW, NW, NE, SE)
 
-    def makeChar(self, name, data):
-        """Draw the data of name into the glyph of the target."""
-        (unicde, name) = self.font.names.getUnicodeAndName(name)
-        dist = self.font.getDistances(name)
-        glyph = self.target.createChar(unicde, name)
-        pen = glyph.glyphPen();
-        psY = len(data['lines'])#postscript Y, zero is on the bottom of the grid
-        height = len(data['lines']) - 1
+    def drawLines(self, pen, lines, left):
+        """Draw the pixel shapes of lines into pen, moved left raster units to the right."""
+        psY = len(lines)#postscript Y, zero is on the bottom of the grid
+        height = len(lines) - 1
         filled = self.isFilled
-        for line in data['lines']:
+        for line in lines:
             psY -= 1
             y = height - psY
             for x,val in enumerate(line):
                 if filled(val):
                     corners = (True, True ,True ,True)
                     if self.data['contextualShape']:
-                        corners = self.getInnerContextualCorners(data['lines'], y, x)
-                    self.drawFilled(pen, x + dist[0], psY, corners)
+                        corners = self.getInnerContextualCorners(lines, y, x)
+                    self.drawFilled(pen, x + left, psY, corners)
                 else:
-                    self.drawEmpty(pen, x + dist[0], psY, self.getOuterContextualCorners(data['lines'], y, x))
-        pen = None
-        glyph.round()
-        if self.data['removeOverlap']: glyph.removeOverlap()
-        glyph.simplify()
-        glyph.width = glyph.vwidth = ( data['width'] + sum(dist) ) * self.data['unit']
-        if self.data['autoHint']: glyph.autoHint()
-        vprint ('built char with unicode:', glyph.unicode, 'name:', name, 'width:', data['width'], glyph.width, level = 3)
+                    self.drawEmpty(pen, x + left, psY, self.getOuterContextualCorners(lines, y, x))
 
     def _getDrawOptions(self):
         if self._drawOptions is None:
@@ -953,6 +2224,14 @@ class FontforgeGenerator(Generator):
             if iR > maxR:
                 vprint('insideCornerRadius', iR,'was too big.', 'It is now width/2 (width * 0.5):', maxR)
                 iR = maxR
+            if self.data['quadratic']:
+                #each pixel shape starts at a multiple of the unit plus the offset, all its points are on integer coordinates
+                if self.data['unit'] != int(self.data['unit']) or self.data['offset'] != int(self.data['offset']):
+                    raise OptionsError('generator.unit and generator.offset must be whole numbers for quadratic outlines')
+                iW, oW = int(round(iW)), int(round(oW))
+                #round before clamping, a rounded up radius of an odd width would be more than half of it
+                iR = min(int(round(iR)), iW // 2)
+                oR = min(int(round(oR)), oW // 2)
             self._drawOptions = {
                 'unit' : self.data['unit'],
                 'offset' : self.data['offset'],
@@ -1009,9 +2288,29 @@ class FontforgeGenerator(Generator):
             if corners[i]:
                 pen.moveTo(cmd[i][0])
                 pen.lineTo(cmd[i][1])
-                pen.curveTo(*cmd[i][2])
+                self.drawCorner(pen, cmd[i][1], cmd[i][0], cmd[i][2])
                 pen.closePath()
 
+    def drawCorner(self, pen, start, corner, points):
+        """
+        Draw a rounded corner from start into pen, points are the two off curve points and the end of the cubic curve.
+
+        If generator.quadratic is True the corner is two quadratic curves instead,
+        their off curve points are on the lines from start and from the end to
+        corner, the point of the angled corner, rounded to integers. The on curve
+        point between them is implied, in the middle of both. Unrounded the curve
+        is at most about 0.3% of the radius off the circle, with the rounding
+        about 0.5% for radii from 12 units, more for smaller radii.
+
+        """
+        if self.data['quadratic']:
+            end = points[2]
+            first = [int(round(a + (c - a) * quadraticKappa)) for a, c in zip(start, corner)]
+            second = [int(round(b + (c - b) * quadraticKappa)) for b, c in zip(end, corner)]
+            pen.qCurveTo(tuple(first), tuple(second), end)
+        else:
+            pen.curveTo(*points)
+
     def drawFilled(self, pen, posX, posY, corners):
         """Draw inside rounded corners only where they belong to."""
         options = self._getDrawOptions()
@@ -1058,7 +2357,7 @@ class FontforgeGenerator(Generator):
                     pen.moveTo(smooth[i][0])
                 elif smooth[i][0] is not lastPos:
                     pen.lineTo(smooth[i][0])
-                pen.curveTo(*smooth[i][1])
+                self.drawCorner(pen, smooth[i][0], angled[i], smooth[i][1])
                 lastPos = smooth[i][1][2]
             else:
                 if(i == 0):
@@ -1066,4 +2365,814 @@ class FontforgeGenerator(Generator):
                 else:
                     pen.lineTo(angled[i])
                 lastPos = angled[i]
-        pen.closePath(); #end the contour
\ No newline at end of file
+        pen.closePath(); #end the contour
+
+
+class SpecimenGenerator(OutlineGenerator):
+    """
+    Write specimens of generator.specimenText as PNG and SVG, laid out and drawn directly from the font, without fontforge.
+
+    The glyphs have the pixel shapes of the FontforgeGenerator, the text is
+    set with the distances, the kern table and the ligatures of
+    generator.specimenFeatures. Each glyph is drawn and rasterized once.
+
+    """
+    def generate(self):
+        start = time.time()
+        lines = [self.layout(text) for text in self.data['specimenText']]
+        for fileExtexsion in self.data['specimenFormats']:
+            fileName = '%s/%s_specimen.%s' % (settings['outputFolder'], self.font.data['fileName'], fileExtexsion)
+            if fileExtexsion == 'png':
+                self.writePNG(fileName, lines)
+            elif fileExtexsion == 'svg':
+                self.writeSVG(fileName, lines)
+            else:
+                raise GeneratorError('the specimen format {0} is unknown, use "png" or "svg"'.format(fileExtexsion))
+            log(1, 'fileWritten', u'wrote a .{format}-file: {file}', format = fileExtexsion, file = fileName)
+        vprint('specimen of', self.font.data['fileName'], 'in %.3f seconds' % (time.time() - start), level = 1)
+
+    def layout(self, text):
+        """Return a tuple of the advance of the line and a list of (glyph name, x) for text, x and the advance in raster units."""
+        names = self.getGlyphNames(text)
+        if 'liga' in self.data['specimenFeatures'] or 'dlig' in self.data['specimenFeatures']:
+            names = self.applyLigatures(names)
+        kern = 'kern' in self.data['specimenFeatures']
+        x = 0
+        glyphs = []
+        for i, name in enumerate(names):
+            if kern and i:
+                x += self.getKerning(names[i - 1], name)
+            glyphs.append((name, x))
+            x += self.font.glyphs[name]['width'] + sum(self.font.getDistances(name))
+        return (x, glyphs)
+
+    def getGlyphNames(self, text):
+        """Return the names of the glyphs for the characters of text, characters without a glyph are left out."""
+        if not hasattr(self, '_byUnicode'):
+            self._byUnicode = dict([(self.font.names.getUnicode(name), name) for name in self.font.glyphs])
+        names = []
+        for char in text:
+            if ord(char) in self._byUnicode:
+                names.append(self._byUnicode[ord(char)])
+            else:
+                log(2, 'noGlyph', u'no glyph for {char!r} in {0}', self.font.data['fileName'], char = char)
+        return names
+
+    def applyLigatures(self, names):
+        """Return names with the ligatures of generator.specimenFeatures applied, the longest first."""
+        ligatures = []
+        for featureTag in ('liga', 'dlig'):
+            if featureTag not in self.data['specimenFeatures']: continue
+            for sub, by in self.font.features.get(featureTag, []):
+                by = self.font.names.getName(by)
+                if by in self.font.glyphs:
+                    ligatures.append((map(self.font.names.nameGetter, sub.split(' ')), by))
+        ligatures.sort(key = lambda ligature: -len(ligature[0]))
+        result = []
+        i = 0
+        while i < len(names):
+            for sub, by in ligatures:
+                if names[i:i + len(sub)] == sub:
+                    result.append(by)
+                    i += len(sub)
+                    break
+            else:
+                result.append(names[i])
+                i += 1
+        return result
+
+    def getKerning(self, first, second):
+        """Return the kerning in raster units between the glyphs first and second, from the classes of both and the kern table."""
+        if not hasattr(self, '_pairs'):
+            self._pairs = dict([((pair[0], pair[1]), pair[2]) for pair in self.font.features['kern']])
+        value = 0
+        for firstClass in self.font.getGlyphClasses(first):
+            if not firstClass.startswith(self.font.data['classRightIndicator']): continue
+            for secondClass in self.font.getGlyphClasses(second):
+                value += self._pairs.get((firstClass, secondClass), 0)
+        return value
+
+    def _getScale(self):
+        """Return pixels per em unit."""
+        return float(self.data['specimenPixels']) / self.data['unit']
+
+    def _getSize(self, lines):
+        """Return the width and height of the specimen in pixels and the height of a line in raster units."""
+        margin = self.data['specimenMargin']
+        lineHeight = self.font.data['lineCount'] + self.data['specimenLeading']
+        width = max([advance for advance, glyphs in lines] + [0]) + 2 * margin
+        height = len(lines) * lineHeight - self.data['specimenLeading'] + 2 * margin
+        return (width * self.data['specimenPixels'], height * self.data['specimenPixels'], lineHeight)
+
+    def _getPositions(self, lines):
+        """Yield (glyph name, x, y) for each glyph of lines, the position of its origin on the baseline in pixels."""
+        pixels = self.data['specimenPixels']
+        margin = self.data['specimenMargin']
+        lineHeight = self._getSize(lines)[2]
+        for index, (advance, glyphs) in enumerate(lines):
+            baseline = margin + index * lineHeight + self.font.data['lineCount'] - self.font.data['descent']
+            for name, x in glyphs:
+                yield (name, (margin + x) * pixels, baseline * pixels)
+
+    def writePNG(self, fileName, lines):
+        width, height, lineHeight = self._getSize(lines)
+        canvas = [[0] * width for y in xrange(height)]
+        rasters = {}
+        for name, originX, originY in self._getPositions(lines):
+            if name not in rasters:
+                pen = specimen.PolygonPen(self._getScale())
+                self.drawLines(pen, self.font.glyphs[name]['lines'], self.font.getDistances(name)[0])
+                rasters[name] = specimen.rasterize(pen.polygons)
+            left, top, rows = rasters[name]
+            for y, row in enumerate(rows):
+                canvasY = originY + top + y
+                if not 0 <= canvasY < height: continue
+                canvasRow = canvas[canvasY]
+                for x, value in enumerate(row):
+                    canvasX = originX + left + x
+                    if value and 0 <= canvasX < width and value > canvasRow[canvasX]:
+                        canvasRow[canvasX] = value
+        specimen.writePNG(fileName, width, height, [[255 - value for value in row] for row in canvas])
+
+    def writeSVG(self, fileName, lines):
+        width, height, lineHeight = self._getSize(lines)
+        paths = []
+        indexes = {}
+        uses = []
+        for name, originX, originY in self._getPositions(lines):
+            if name not in indexes:
+                pen = specimen.SVGPathPen(self._getScale())
+                self.drawLines(pen, self.font.glyphs[name]['lines'], self.font.getDistances(name)[0])
+                indexes[name] = len(paths)
+                paths.append(pen.getData())
+            uses.append((indexes[name], originX, originY))
+        specimen.writeSVG(fileName, width, height, paths, uses, self.instructions['metadata']['fullname'])
+
+
+#the FontforgeGenerator whose glyphs are drawn by the processes of the pool in FontforgeGenerator.makeChars
+_poolGenerator = None
+
+def _drawOutline(name):
+    return _poolGenerator.drawOutline(name)
+
+def _drawGivenOutline(args):
+    return _poolGenerator.drawOutline(*args)
+
+class FontforgeGenerator(OutlineGenerator):
+    """makes a fontforge font (or anything fontforge can generate) from a font"""
+    #the font drawOutline draws into, each process has its own
+    _outlineFont = None
+
+    def __init__(self,  instructions, font):
+        super(FontforgeGenerator, self).__init__(instructions, font)
+        #glyph name : the metrics of drawChar and the width, for each drawn glyph
+        self.glyphMetrics = {}
+        #(glyph name, scale) : bitmap of _getBitmapGlyph, made by streamChars before the lines are released
+        self._strikeBitmaps = {}
+        #the most glyphs streamChars held with their lines at once, being loaded or drawn
+        self.mostHeldGlyphs = 0
+        importFontforge()
+        self.target = fontforge.font()
+        self.target.em = self.data['em']
+        self.target.is_quadratic = bool(self.data['quadratic'])
+        self._setup()
+        self._setupMetadata()
+
+    def _setup(self):
+        """set up the fontforge font"""
+        #initial setting
+        font = self.font
+        #seems like there has to be at least one char in the font for the setup
+        stub = self.target.createChar(-1, '_stub')
+        metrics = self.getVerticalMetrics()
+        self.target.ascent = metrics['ascent']
+        self.target.descent = metrics['descent']
+        self.target.upos = metrics['upos']
+        self.target.uwidth = metrics['uwidth']
+        fontFolder = font.data['folder']
+        if  font.data['featureFile']:
+            self.target.mergeFeature(u'%s/%s' % (fontFolder, font.data['featureFile']))
+            vprint('merged featureFile: %s' % (font.data['featureFile'],), level = 2)
+        self.target.removeGlyph(stub)
+
+    @staticmethod
+    def _getFeatureScriptLangTuple(featureTag, languageSystems):
+        """obscure thing that"""
+        return ((
+            featureTag,
+            tuple([(script, (lang,),) for script, lang in languageSystems])
+            ),)
+
+    def addLigatures(self):
+        """adding ligatures it is best when the glyphs in the font are already build, right?"""
+        for featureTag in ('liga', 'dlig', 'hlig', 'ccmp'):
+            if featureTag not in self.font.features or len(self.font.features[featureTag]) < 1: continue
+            lookupName = '{0}Ligatures'.format(featureTag)
+            subtableName = '{0}Sub 0'.format(lookupName)
+            self.target.addLookup(
+                lookupName,
+                'gsub_ligature',
+                (),
+                self._getFeatureScriptLangTuple(featureTag, self.font.features['languagesystems'])
+            )
+            self.target.addLookupSubtable(lookupName, subtableName)
+            for sub, by in self.font.features[featureTag]:
+                glyph = self.getLigatureGlyph(sub, by)
+                glyph.addPosSub(subtableName, map(self.font.names.nameGetter, sub.split(' ')))
+
+    def getLigatureGlyph(self, sub, by):
+        """Return the glyph of the ligature by, create it if it doesn't exist."""
+        glyphName = self.font.names.getName(by)
+        if glyphName in self.target:
+            return self.target[glyphName]
+        log(2, 'ligatureCreated', u'created {glyph} ({rawName}) which is said beeing a ligature for {sub} but didn\'t exist until now.',
+            glyph = glyphName, rawName = by, sub = sub)
+        return self.target.createChar(*self.font.names.getUnicodeAndName(by))
+
+    def mergeFeatureFile(self):
+        """Merge the kerning and the ligatures as the one feature file of the FeatureFileGenerator, instead of addLigatures and addKerning."""
+        for featureTag in ('liga', 'dlig', 'hlig', 'ccmp'):
+            for sub, by in self.font.features.get(featureTag, []):
+                self.getLigatureGlyph(sub, by)
+        fileName = FeatureFileGenerator(self.instructions, self.font).build()
+        self.target.mergeFeature(fileName)
+        vprint('merged the generated feature file', fileName, level = 2)
+
+    def addKerning(self):
+        featureTag = 'kern'
+        lookupName = '{0}Kerning'.format(featureTag)
+        subtableName = '{0}Sub 0'.format(lookupName)
+        self.target.addLookup(
+            lookupName,
+            'gpos_pair',
+            (),
+            self._getFeatureScriptLangTuple(featureTag, self.font.features['languagesystems'])
+        )
+        firstClasses = tuple(filter(lambda x: x.startswith(self.font.data['classRightIndicator']), self.font.classes.keys()))
+        secondClasses = tuple(filter(lambda x: x.startswith(self.font.data['classLeftIndicator']), self.font.classes.keys()))
+        pairs = {}
+        for pair in self.font.features['kern']:
+            pairs[(pair[0], pair[1])] = pair[2]
+        #The offsets argument is a tuple of kerning offsets. There must be as many entries as len(first-class)*len(second-class).
+        offsets = []
+        for f in firstClasses:
+            for s in secondClasses:
+                offsets.append(self.data['unit'] * pairs.get((f,s),0))
+        self.target.addKerningClass(\
+            lookupName,\
+            subtableName,\
+            [self.font.classes[k] for k in firstClasses],\
+            [self.font.classes[k] for k in secondClasses],\
+            offsets)
+
+    def _setupMetadata(self):
+        metadata = self.instructions['metadata']
+        target = self.target
+        target.fontname = metadata['fontname']
+        target.weight = metadata['weight']
+        target.fullname = metadata['fullname']
+        target.familyname = metadata['familyname']
+        target.copyright = metadata['copyright']
+        target.version = metadata['version']
+        target.comment = metadata['comment']
+        for language, data in metadata['more'].iteritems():
+            for strid, string in data.iteritems():
+                try:
+                    target.appendSFNTName(settings['sfntLookup'].get(language, language), settings['sfntLookup'].get(strid, strid), string)
+                except TypeError, e:
+                    vprint ('some metadata has not been set:', language, strid, 'Message:', e)
+
+    def build(self):
+        if self.data['streamWindow']:
+            self.streamChars()
+        else:
+            duplicates = self.getDuplicates()
+            composites = self.getComposites(duplicates)
+            self.makeChars(sorted([name for name in self.font.glyphs if name not in duplicates and name not in composites]))
+            for name, (base, mark, offset) in sorted(composites.iteritems()):
+                self.makeComposite(name, base, mark, offset)
+            if composites and self.data['verifyComposites']:
+                self.verifyComposites(composites)
+            for name, original in sorted(duplicates.iteritems()):
+                self.makeDuplicate(name, original)
+        if self.data['generatedFeatureFile']:
+            self.mergeFeatureFile()
+        else:
+            self.addLigatures()
+            self.addKerning()
+        self.checkPointBudgets()
+
+    def generate(self):
+        self.build();
+        generated = {}
+        webFormats = []
+        for fileExtexsion in self.data['fileFormats']:
+            if fileExtexsion in sfnt.webFormats:
+                webFormats.append(fileExtexsion)
+                continue
+            fileName = self._getFileName(fileExtexsion)
+            if fileExtexsion == 'sfd':
+                self.target.save(fileName)
+            else:
+                self.target.generate(fileName, flags = self.data['ffGenerateFlags'])
+                self._embedBitmapStrikes(fileName, fileExtexsion)
+                generated[fileExtexsion] = fileName
+            log(1, 'fileWritten', u'wrote a .{format}-file: {file}', format = fileExtexsion, file = fileName)
+        if len(webFormats):
+            self.generateWebFonts(webFormats, generated)
+        self.writeMetricsReport(generated)
+
+    def checkPointBudgets(self):
+        """Raise a GeneratorError if a drawn glyph has more points than generator.pointBudgets or generator.pointBudget allow."""
+        over = []
+        for name, metrics in sorted(self.glyphMetrics.iteritems()):
+            budget = self.data['pointBudgets'].get(name, self.data['pointBudget'])
+            if budget and metrics['points'] > budget:
+                over.append(u'{0} ({1} of {2})'.format(name, metrics['points'], budget))
+        if over:
+            raise GeneratorError(u'{0} glyphs have more points than their budget: {1}'.format(len(over), u', '.join(over)).encode('utf-8'))
+
+    def writeMetricsReport(self, generated = {}):
+        """
+        Write the glyphMetrics to generator.metricsReportFile.
+
+        The glyphs are a list sorted by the count of points, the most first,
+        each has its name and the bytes of its outline in each of the
+        generated sfnt fonts. generated is a dict of file extension : file name,
+        formats that are no sfnt (e.g. svg, pfb, bdf) are skipped. For each
+        generated font the bytes of each table are in "tables".
+
+        """
+        if not self.data['metricsReportFile']: return
+        glyphs = []
+        for name, metrics in self.glyphMetrics.iteritems():
+            entry = dict(metrics)
+            entry['name'] = name
+            entry['bytes'] = {}
+            glyphs.append(entry)
+        tables = {}
+        for fileExtexsion, fileName in sorted(generated.iteritems()):
+            if fileExtexsion not in sfnt.sfntFormats: continue
+            flavor, fontTables = sfnt.readSFNTFile(fileName)
+            tables[fileExtexsion] = dict([(tag, len(data)) for tag, data in fontTables.iteritems()])
+            sizes = sfnt.glyphSizes(fontTables)
+            cmap = sfnt.readCmap(fontTables['cmap'])
+            for entry in glyphs:
+                unicde = self.font.names.getUnicode(entry['name'])
+                if unicde in cmap:
+                    entry['bytes'][fileExtexsion] = sizes[cmap[unicde]]
+        glyphs.sort(key = lambda entry: (-entry['points'], entry['name']))
+        totals = {}
+        for key in ('rawContours', 'rawPoints', 'overlapRemovedContours', 'overlapRemovedPoints', 'contours', 'points', 'hints'):
+            totals[key] = sum([entry.get(key, 0) for entry in glyphs])
+        fileName = '%s/%s_%s' % (settings['outputFolder'], self.font.data['fileName'], self.data['metricsReportFile'])
+        writeJson(fileName, {'glyphs' : glyphs, 'tables' : tables, 'totals' : totals})
+
+    def _getFileName(self, fileExtexsion):
+        return '%s/%s.%s' % (settings['outputFolder'] , self.font.data['fileName'], fileExtexsion)
+
+    def generateWebFonts(self, webFormats, generated = {}):
+        """
+        Write each of webFormats by wrapping the tables of one compiled sfnt.
+
+        The sfnt is the file of generator.webFontSource in generated if it was
+        written before, otherwise it is generated once into a temporary file.
+
+        """
+        sourceFormat = self.data['webFontSource']
+        if sourceFormat in generated:
+            flavor, tables = sfnt.readSFNTFile(generated[sourceFormat])
+        else:
+            handle, tempName = tempfile.mkstemp(suffix = '.' + sourceFormat)
+            os.close(handle)
+            try:
+                self.target.generate(tempName, flags = self.data['ffGenerateFlags'])
+                self._embedBitmapStrikes(tempName, sourceFormat)
+                flavor, tables = sfnt.readSFNTFile(tempName)
+            finally:
+                os.remove(tempName)
+        for fileExtexsion in webFormats:
+            fileName = self._getFileName(fileExtexsion)
+            level = self.data['{0}CompressionLevel'.format(fileExtexsion)]
+            try:
+                size = sfnt.writeWebFont(fileName, fileExtexsion, flavor, tables, level)
+            except sfnt.SFNTError, e:
+                raise GeneratorError(str(e))
+            log(1, 'fileWritten', u'wrote a .{format}-file: {file} {bytes} bytes', format = fileExtexsion, file = fileName, bytes = size)
+
+    def _embedBitmapStrikes(self, fileName, fileExtexsion):
+        if not self.data['bitmapStrikes'] or fileExtexsion not in sfnt.sfntFormats: return
+        count = sfnt.embedBitmapStrikes(fileName, self.getBitmapStrikes)
+        vprint('embedded', count, 'bitmap strikes into', fileName, level = 1)
+
+    def getBitmapStrikes(self, cmap):
+        """
+        Return the bitmap strikes of generator.bitmapStrikes as needed by sfnt.buildBitmapTables.
+
+        The bitmaps are made directly from the glyph data, each raster unit
+        becomes a square of ppem / (em / unit) pixels. cmap is a dict of
+        unicode : glyph index of the generated font.
+
+        """
+        strikes = []
+        for ppem in sorted(self.data['bitmapStrikes']):
+            scale = self._getStrikeScale(ppem)
+            glyphs = {}
+            for name, data in self.font.glyphs.iteritems():
+                (unicde, name) = self.font.names.getUnicodeAndName(name)
+                if unicde not in cmap:
+                    log(2, 'noBitmap', u'no bitmap for {glyph} it is not in the cmap of the generated font', glyph = name)
+                    continue
+                if (name, scale) in self._strikeBitmaps:
+                    glyphs[cmap[unicde]] = self._strikeBitmaps[(name, scale)]
+                else:
+                    glyphs[cmap[unicde]] = self._getBitmapGlyph(name, data, scale)
+            strikes.append({
+                'ppem' : ppem,
+                'ascender' : int(round(float(self.target.ascent) * ppem / self.data['em'])),
+                'descender' : -int(round(float(self.target.descent) * ppem / self.data['em'])),
+                'glyphs' : glyphs,
+            })
+            vprint('bitmap strike at', ppem, 'ppem with', len(glyphs), 'glyphs', level = 2)
+        return strikes
+
+    def _getStrikeScale(self, ppem):
+        """Return the pixels per raster unit of the bitmap strike at ppem."""
+        if (ppem * self.data['unit']) % self.data['em']:
+            raise GeneratorError('bitmap strike ppem {0} is not a multiple of em / unit ({1})'.format(ppem, float(self.data['em']) / self.data['unit']))
+        return ppem * self.data['unit'] // self.data['em']
+
+    def _getBitmapGlyph(self, name, data, scale):
+        """Return the bitmap of the glyph from Font.getBitmap if it fits into the metrics of a bitmap strike, also without ink."""
+        metrics, rows = self.font.getBitmap(name, scale)
+        if not sfnt.fitsBigGlyphMetrics(metrics):
+            raise GeneratorError('the bitmap of {0} at scale {1} does not fit into the metrics of a bitmap strike'.format(name, scale))
+        return (metrics, rows)
+
+    def makeChar(self, name, data, outline = None):
+        """
+        Draw the data of name into the glyph of the target.
+
+        If outline is given it is used instead of drawing, see drawOutline.
+        The glyph is hinted here in the target in both cases, see hintChar.
+
+        """
+        (unicde, name) = self.font.names.getUnicodeAndName(name)
+        dist = self.font.getDistances(name)
+        glyph = self.target.createChar(unicde, name)
+        if outline is None:
+            metrics = self.drawChar(glyph, data, dist)
+        else:
+            metrics = self.setOutline(glyph, outline)
+        self.hintChar(glyph, metrics)
+        glyph.width = glyph.vwidth = ( data['width'] + sum(dist) ) * self.data['unit']
+        metrics['width'] = glyph.width
+        self.glyphMetrics[name] = metrics
+        log(3, 'glyphBuilt', u'built char with unicode: {unicode} name: {glyph} width: {0} {width}', data['width'],
+            unicode = glyph.unicode, glyph = name, width = glyph.width)
+
+    def drawChar(self, glyph, data, dist):
+        """
+        Draw the lines of data into glyph, then clean it up.
+
+        Return a dict of the counts of contours and points as drawn (raw...),
+        after removeOverlap (overlapRemoved...) and after simplify.
+
+        """
+        pen = glyph.glyphPen();
+        self.drawLines(pen, data['lines'], dist[0])
+        pen = None
+        metrics = {}
+        self._countOutline(glyph, metrics, 'raw')
+        glyph.round()
+        if self.data['removeOverlap']:
+            glyph.removeOverlap()
+            self._countOutline(glyph, metrics, 'overlapRemoved')
+        glyph.simplify()
+        if self.data['quadratic']:
+            #removeOverlap and simplify may make points between the integer coordinates
+            glyph.round()
+        self._countOutline(glyph, metrics, '')
+        return metrics
+
+    def hintChar(self, glyph, metrics):
+        """
+        Hint glyph if generator.autoHint and add the count of its hints to metrics.
+
+        FontForge takes the blue zones from the font when it has no BlueValues,
+        so this is done in the target, never in the font of drawOutline, to get
+        the same hints with any count of processes.
+
+        """
+        if self.data['autoHint']: glyph.autoHint()
+        metrics['hints'] = len(glyph.hhints) + len(glyph.vhints)
+
+    @staticmethod
+    def _countOutline(glyph, metrics, prefix):
+        contours = [len(contour) for contour in glyph.foreground]
+        metrics[prefix + ('Contours' if prefix else 'contours')] = len(contours)
+        metrics[prefix + ('Points' if prefix else 'points')] = sum(contours)
+
+    def makeChars(self, names):
+        """
+        Make the glyphs of names in the order of names, with generator.processes processes.
+
+        With more than one process the outlines are made by drawOutline in
+        the processes of a pool and then set into the target in order, so the
+        result does not depend on which process was faster.
+
+        """
+        processes = self.data['processes'] or multiprocessing.cpu_count()
+        if processes < 2 or len(names) < 2:
+            for name in names:
+                self.makeChar(name, self.font.glyphs[name])
+            return
+        global _poolGenerator
+        start = time.time()
+        #the pool is forked from this process, so the workers know this generator and its font
+        _poolGenerator = self
+        pool = multiprocessing.Pool(processes)
+        try:
+            chunkSize = max(1, len(names) // (processes * 4))
+            for name, outline in zip(names, pool.imap(_drawOutline, names, chunkSize)):
+                self.makeChar(name, self.font.glyphs[name], outline)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+            _poolGenerator = None
+        log(1, 'glyphsDrawn', u'drew {glyphs} glyphs in {processes} processes in {seconds:.3f} seconds',
+            glyphs = len(names), processes = processes, seconds = time.time() - start)
+
+    def streamChars(self):
+        """
+        Load, draw and insert the glyphs one at a time in the order of their names, see Font.streamGlyphs.
+
+        Each glyph is released when it is drawn, only its metadata stays in
+        the font. With more than one process (generator.processes) at most
+        generator.streamWindow glyphs are sent to the pool and not yet inserted.
+        Duplicates are made of the first glyph with the same fingerprint after
+        all glyphs are drawn, like getDuplicates. Composites need the ink of all
+        glyphs at once, so they are not made. The bitmaps of generator.bitmapStrikes
+        are made before a glyph is released, getBitmapStrikes uses them later.
+
+        """
+        mode = self.data['duplicateGlyphs']
+        if mode not in ('reference', 'copy', False):
+            raise GeneratorError('generator.duplicateGlyphs must be "reference", "copy" or false, not {0}'.format(mode))
+        window = max(1, self.data['streamWindow'])
+        processes = self.data['processes'] or multiprocessing.cpu_count()
+        filled = self.font.data['filled']
+        groups = {}#fingerprint : names
+        originals = {}#fingerprint : name of the drawn glyph, only for glyphs with filled pixels
+        duplicates = []
+        pending = collections.deque()
+        pool = None
+        global _poolGenerator
+        scales = [self._getStrikeScale(ppem) for ppem in self.data['bitmapStrikes']]
+        start = time.time()
+        if processes > 1:
+            #forked before any glyph is loaded, the glyphs are sent to the processes
+            _poolGenerator = self
+            pool = multiprocessing.Pool(processes)
+        try:
+            for name in self.font.streamGlyphs(self.instructions):
+                #the glyphs of the font with lines and the lines sent with each pending glyph
+                self.mostHeldGlyphs = max(self.mostHeldGlyphs, self.font.heldGlyphs + len(pending))
+                data = self.font.glyphs[name]
+                fingerprint = self.font.getFingerprint(name)
+                groups.setdefault(fingerprint, []).append(name)
+                if mode and fingerprint in originals:
+                    duplicates.append((name, originals[fingerprint]))
+                elif pool is None:
+                    self.makeChar(name, data)
+                else:
+                    #the arguments are pickled later by the pool, after the glyph is released
+                    given = {'lines' : data['lines'], 'width' : data['width']}
+                    pending.append((name, pool.apply_async(_drawGivenOutline, ((name, given, self.font.getDistances(name)),))))
+                if mode and fingerprint not in originals and filled in u''.join(data['lines']):
+                    originals[fingerprint] = name
+                for scale in scales:
+                    self._strikeBitmaps[(name, scale)] = self._getBitmapGlyph(name, data, scale)
+                self.font.releaseGlyph(name)
+                while len(pending) >= window:
+                    name, result = pending.popleft()
+                    self.makeChar(name, self.font.glyphs[name], result.get())
+            while pending:
+                name, result = pending.popleft()
+                self.makeChar(name, self.font.glyphs[name], result.get())
+            if pool is not None:
+                pool.close()
+        except:
+            if pool is not None:
+                pool.terminate()
+            raise
+        finally:
+            if pool is not None:
+                pool.join()
+                _poolGenerator = None
+        for name, original in duplicates:
+            self.makeDuplicate(name, original)
+        self.writeDuplicatesReport(sorted([sorted(group) for group in groups.itervalues() if len(group) > 1]))
+        log(1, 'glyphsStreamed', u'streamed {glyphs} drawn glyphs and {duplicates} duplicates in {seconds:.3f} seconds',
+            glyphs = len(self.glyphMetrics), duplicates = len(duplicates), seconds = time.time() - start)
+
+    def drawOutline(self, name, data = None, dist = None):
+        """
+        Return the outline of the glyph with name as drawn by drawChar in a font of its own.
+
+        data and dist are those of the glyph in the font, if not given.
+        The outline is a tuple (contours, metrics), each contour is a tuple
+        (points, closed) where points are tuples (x, y, onCurve), metrics is
+        the result of drawChar. It is not hinted, see hintChar.
+
+        """
+        if self._outlineFont is None:
+            self._outlineFont = fontforge.font()
+            self._outlineFont.em = self.data['em']
+            self._outlineFont.is_quadratic = bool(self.data['quadratic'])
+        if data is None:
+            data = self.font.glyphs[name]
+            dist = self.font.getDistances(name)
+        glyph = self._outlineFont.createChar(-1, name)
+        metrics = self.drawChar(glyph, data, dist)
+        outline = (self._getContours(glyph.foreground), metrics)
+        self._outlineFont.removeGlyph(glyph)
+        return outline
+
+    def setOutline(self, glyph, outline):
+        """Set the outline returned by drawOutline into glyph and return its metrics."""
+        contours, metrics = outline
+        layer = fontforge.layer()
+        layer.is_quadratic = bool(self.data['quadratic'])
+        for points, closed, quadratic in contours:
+            contour = fontforge.contour()
+            contour.is_quadratic = quadratic
+            for x, y, onCurve in points:
+                contour += fontforge.point(x, y, onCurve)
+            contour.closed = closed
+            layer += contour
+        glyph.foreground = layer
+        return dict(metrics)
+
+    def getDuplicates(self):
+        """
+        Return a dict of glyph name : name of the glyph that is drawn instead, by generator.duplicateGlyphs.
+
+        The first name of each group of Font.getDuplicateGroups is drawn, groups
+        without filled pixels are not in the dict, there is nothing to draw.
+        The groups are written to generator.duplicatesReportFile.
+
+        """
+        mode = self.data['duplicateGlyphs']
+        if mode not in ('reference', 'copy', False):
+            raise GeneratorError('generator.duplicateGlyphs must be "reference", "copy" or false, not {0}'.format(mode))
+        groups = self.font.getDuplicateGroups()
+        self.writeDuplicatesReport(groups)
+        duplicates = {}
+        if not mode:
+            return duplicates
+        filled = self.font.data['filled']
+        for group in groups:
+            if filled not in u''.join(self.font.glyphs[group[0]]['lines']):
+                continue
+            for name in group[1:]:
+                duplicates[name] = group[0]
+        vprint(len(duplicates), 'glyphs are made as', mode, 'of', len(set(duplicates.values())), 'drawn glyphs', level = 1)
+        return duplicates
+
+    def writeDuplicatesReport(self, groups):
+        """Write the groups of duplicate glyphs to generator.duplicatesReportFile."""
+        if self.data['duplicatesReportFile']:
+            fileName = '%s/%s_%s' % (settings['outputFolder'], self.font.data['fileName'], self.data['duplicatesReportFile'])
+            writeJson(fileName, {'duplicateGlyphs' : groups})
+
+    def makeDuplicate(self, name, original):
+        """Make the glyph of name from the already built glyph of original, see generator.duplicateGlyphs."""
+        (unicde, name) = self.font.names.getUnicodeAndName(name)
+        source = self.target[self.font.names.getName(original)]
+        glyph = self.target.createChar(unicde, name)
+        if self.data['duplicateGlyphs'] == 'copy':
+            glyph.foreground = source.foreground
+            glyph.hhints = source.hhints
+            glyph.vhints = source.vhints
+        else:
+            glyph.addReference(source.glyphname)
+        glyph.width = glyph.vwidth = source.width
+        log(3, 'duplicateBuilt', u'built char with unicode: {unicode} name: {glyph} as {0} of {original}', self.data['duplicateGlyphs'],
+            unicode = glyph.unicode, glyph = name, original = source.glyphname)
+
+    def getComposites(self, exclude = ()):
+        """
+        Return the dict of Font.getDecompositions if generator.composites is True, otherwise an empty dict.
+
+        The pixels of base and mark may only touch if every pixel is drawn on
+        its own, without rounded corners that depend on the neighbours.
+        The decompositions are written to generator.compositesReportFile.
+
+        """
+        if not self.data['composites']:
+            return {}
+        options = self._getDrawOptions()
+        separate = options['oR'] >= 1 or (self.data['contextualShape'] and options['iR'] >= 1)
+        composites = self.font.getDecompositions(exclude, separate)
+        if self.data['compositesReportFile']:
+            fileName = '%s/%s_%s' % (settings['outputFolder'], self.font.data['fileName'], self.data['compositesReportFile'])
+            report = {}
+            for name, (base, mark, offset) in composites.iteritems():
+                report[name] = {'base' : base, 'mark' : mark, 'offset' : offset}
+            writeJson(fileName, {'composites' : report})
+        vprint(len(composites), 'glyphs are made as composites of a base and a mark', level = 1)
+        return composites
+
+    def makeComposite(self, name, base, mark, offset):
+        """Make the glyph of name from references to the already built glyphs base and mark, the mark moved by offset."""
+        data = self.font.glyphs[name]
+        dist = self.font.getDistances(name)
+        (unicde, name) = self.font.names.getUnicodeAndName(name)
+        unit = self.data['unit']
+        glyph = self.target.createChar(unicde, name)
+        glyph.addReference(base)
+        #offset is in lines down, postscript y goes up
+        glyph.addReference(mark, (1, 0, 0, 1, offset[0] * unit, -offset[1] * unit))
+        glyph.width = glyph.vwidth = ( data['width'] + sum(dist) ) * unit
+        log(3, 'compositeBuilt', u'built char with unicode: {unicode} name: {glyph} as composite of {base} and {mark} {offset}',
+            unicode = glyph.unicode, glyph = name, base = base, mark = mark, offset = offset)
+
+    def verifyComposites(self, composites, samples = 4):
+        """
+        Raise a GeneratorError if a composite doesn't cover the same pixels as the glyph drawn of all its pixels.
+
+        The outlines of the references in the target font, placed by their
+        transformations, and the outline of drawOutline are rasterized with
+        specimen.rasterize at four pixels per raster unit. A pixel may differ
+        by one of the samples * samples samples, for rounding.
+
+        """
+        scale = 4.0 / self.data['unit']
+        tolerance = 255 // (samples * samples) + 1
+        different = []
+        for name in sorted(composites):
+            composite = specimen.PolygonPen(scale)
+            for reference, transform in self.target[self.font.names.getName(name)].references:
+                self._drawContours(composite, self._getContours(self.target[reference].foreground), transform)
+            whole = specimen.PolygonPen(scale)
+            self._drawContours(whole, self.drawOutline(name)[0])
+            first = self._getPixels(specimen.rasterize(composite.polygons, samples))
+            second = self._getPixels(specimen.rasterize(whole.polygons, samples))
+            if True in [abs(first.get(pixel, 0) - second.get(pixel, 0)) > tolerance for pixel in set(first) | set(second)]:
+                different.append(name)
+        if different:
+            raise GeneratorError('{0} composites are not the same as their glyphs: {1}'.format(len(different), ', '.join(different)))
+        log(1, 'compositesVerified', u'{0} composites are the same as their glyphs', len(composites))
+
+    def _getPixels(self, raster):
+        """Return a dict of (x, y) : coverage of the covered pixels of a result of specimen.rasterize."""
+        left, top, rows = raster
+        return dict([((left + x, top + y), value) for y, row in enumerate(rows) for x, value in enumerate(row) if value])
+
+    def _getContours(self, layer):
+        """Return the contours of layer as tuples (points, closed, quadratic), points are tuples (x, y, onCurve)."""
+        return tuple([(tuple([(point.x, point.y, point.on_curve) for point in contour]), contour.closed, contour.is_quadratic)
+            for contour in layer])
+
+    def _drawContours(self, pen, contours, transform = (1, 0, 0, 1, 0, 0)):
+        """
+        Draw contours of _getContours into pen, transformed like a reference (xx, xy, yx, yy, dx, dy).
+
+        In quadratic contours any count of off curve points may follow each
+        other, with implied on curve points between them, they are drawn as
+        one qCurveTo, see specimen.splitQuadratic. In cubic contours two off
+        curve points make a curveTo.
+
+        """
+        xx, xy, yx, yy, dx, dy = transform
+        for points, closed, quadratic in contours:
+            points = [(x * xx + y * yx + dx, x * xy + y * yy + dy, onCurve) for x, y, onCurve in points]
+            if not points:
+                continue
+            starts = [index for index, point in enumerate(points) if point[2]]
+            if starts:
+                points = points[starts[0]:] + points[:starts[0]]
+            elif quadratic:
+                #no on curve point at all, start at the implied one between the last and the first point
+                (x0, y0, onCurve), (x1, y1, onCurve) = points[-1], points[0]
+                points = [((x0 + x1) * 0.5, (y0 + y1) * 0.5, True)] + points
+            else:
+                continue
+            pen.moveTo(points[0][:2])
+            offCurve = []
+            for x, y, onCurve in points[1:] + (points[:1] if closed else []):
+                if not onCurve:
+                    offCurve.append((x, y))
+                    continue
+                if not offCurve:
+                    pen.lineTo((x, y))
+                elif quadratic or len(offCurve) == 1:
+                    pen.qCurveTo(*(offCurve + [(x, y)]))
+                else:
+                    pen.curveTo(offCurve[0], offCurve[1], (x, y))
+                offCurve = []
+            pen.closePath()
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""Write native bitmap font formats: BDF, PCF and PSF2."""
+#    This file is part of graphicore Bitmap Font Building.
+#
+#    graphicore Bitmap Font Building, this program builds bitmap fonts
+#    Copyright (c) 2010, Lasse Fister lasse@graphicore.de, http://graphicore.de
+#
+#    graphicore Bitmap Font Building is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# All writers take the same two arguments:
+#   info: a dict with the keys
+#       fontname, familyname, weight, copyright: strings
+#       pixelSize, ascent, descent: integers, in pixels
+#   glyphs: a list of dicts sorted by unicode, with the keys
+#       name: the glyph name, unicode: the codepoint
+#       metrics: a tuple (height, width, bearingX, bearingY, advance) in pixels
+#       rows: a list of height rows, each a list of width booleans
+
+import struct
+
+bitmapFormats = ('bdf', 'pcf', 'psf')
+
+def _ascii(text):
+    """Return text as a single line ascii string, to be used in the properties of a bdf."""
+    if isinstance(text, unicode):
+        text = text.encode('ascii', 'replace')
+    return ' '.join(text.splitlines())
+
+def _hexRows(rows):
+    """Return each row of pixels as a hex string padded to whole bytes, like in the BITMAP section of a bdf."""
+    result = []
+    for row in rows:
+        bits = ''.join(['1' if pixel else '0' for pixel in row])
+        bits += '0' * (-len(bits) % 8)
+        result.append(''.join(['%02X' % int(bits[i:i + 8], 2) for i in xrange(0, len(bits), 8)]))
+    return result
+
+def _boundingBox(glyphs):
+    """Return (width, height, xOffset, yOffset) of the box that contains all glyphs."""
+    boxes = [g['metrics'] for g in glyphs if g['metrics'][0] and g['metrics'][1]]
+    if not boxes:
+        return (0, 0, 0, 0)
+    left = min([m[2] for m in boxes])
+    right = max([m[2] + m[1] for m in boxes])
+    top = max([m[3] for m in boxes])
+    bottom = min([m[3] - m[0] for m in boxes])
+    return (right - left, top - bottom, left, bottom)
+
+def buildBDF(info, glyphs):
+    """Return the text of a Glyph Bitmap Distribution Format (BDF) 2.1 font."""
+    box = _boundingBox(glyphs)
+    average = sum([g['metrics'][4] for g in glyphs]) * 10 // max(len(glyphs), 1)
+    xlfd = '-%s-%s-%s-R-Normal--%d-%d-75-75-P-%d-ISO10646-1' % ('graphicoreBMFB',
+        _ascii(info['familyname']).replace('-', ' '), _ascii(info['weight']).replace('-', ' '),
+        info['pixelSize'], info['pixelSize'] * 10, average)
+    properties = (
+        ('FONT_ASCENT', info['ascent']),
+        ('FONT_DESCENT', info['descent']),
+        ('PIXEL_SIZE', info['pixelSize']),
+        ('POINT_SIZE', info['pixelSize'] * 10),
+        ('RESOLUTION_X', 75),
+        ('RESOLUTION_Y', 75),
+        ('SPACING', '"P"'),
+        ('AVERAGE_WIDTH', average),
+        ('CHARSET_REGISTRY', '"ISO10646"'),
+        ('CHARSET_ENCODING', '"1"'),
+        ('FAMILY_NAME', '"%s"' % _ascii(info['familyname']).replace('"', '""')),
+        ('WEIGHT_NAME', '"%s"' % _ascii(info['weight']).replace('"', '""')),
+        ('COPYRIGHT', '"%s"' % _ascii(info['copyright']).replace('"', '""')),
+    )
+    lines = [
+        'STARTFONT 2.1',
+        'FONT %s' % xlfd,
+        'SIZE %d 75 75' % info['pixelSize'],
+        'FONTBOUNDINGBOX %d %d %d %d' % box,
+        'STARTPROPERTIES %d' % len(properties),
+    ]
+    lines += ['%s %s' % prop for prop in properties]
+    lines += ['ENDPROPERTIES', 'CHARS %d' % len(glyphs)]
+    for glyph in glyphs:
+        height, width, bearingX, bearingY, advance = glyph['metrics']
+        lines += [
+            'STARTCHAR %s' % glyph['name'],
+            'ENCODING %d' % glyph['unicode'],
+            'SWIDTH %d 0' % (advance * 72000 // (info['pixelSize'] * 75)),
+            'DWIDTH %d 0' % advance,
+            'BBX %d %d %d %d' % (width, height, bearingX, bearingY - height),
+            'BITMAP',
+        ]
+        lines += _hexRows(glyph['rows'])
+        lines.append('ENDCHAR')
+    lines.append('ENDFONT')
+    return '\n'.join(lines) + '\n'
+
+#see: http://fontforge.github.io/pcf-format.html
+PCF_PROPERTIES = 1 << 0
+PCF_ACCELERATORS = 1 << 1
+PCF_METRICS = 1 << 2
+PCF_BITMAPS = 1 << 3
+PCF_BDF_ENCODINGS = 1 << 5
+PCF_SWIDTHS = 1 << 6
+PCF_GLYPH_NAMES = 1 << 7
+PCF_BDF_ACCELERATORS = 1 << 8
+#most significant byte and bit first, glyph rows padded to 4 bytes
+PCF_FORMAT = 0x0C | 0x02
+
+def _pcfMetrics(metrics):
+    """Return the uncompressed pcf metrics of a glyph for metrics as in the glyph dicts."""
+    height, width, bearingX, bearingY, advance = metrics
+    return (bearingX, bearingX + width, advance, bearingY, height - bearingY, 0)
+
+def _pcfAccelerators(info, glyphs):
+    pcfMetrics = [_pcfMetrics(g['metrics']) for g in glyphs] or [(0, 0, 0, 0, 0, 0)]
+    minBounds = tuple([min([m[i] for m in pcfMetrics]) for i in xrange(6)])
+    maxBounds = tuple([max([m[i] for m in pcfMetrics]) for i in xrange(6)])
+    constantWidth = int(minBounds[2] == maxBounds[2])
+    return struct.pack('<L', PCF_FORMAT) + struct.pack('>BBBBBBBBlll',
+        0,#noOverlap
+        0,#constantMetrics
+        0,#terminalFont
+        constantWidth,
+        0,#inkInside
+        0,#inkMetrics
+        0,#drawDirection left to right
+        0,
+        info['ascent'], info['descent'],
+        max([m[1] - m[2] for m in pcfMetrics]),#maxOverlap
+    ) + struct.pack('>6h', *minBounds) + struct.pack('>6h', *maxBounds)
+
+def _pcfProperties(info):
+    properties = (
+        ('FAMILY_NAME', _ascii(info['familyname'])),
+        ('WEIGHT_NAME', _ascii(info['weight'])),
+        ('COPYRIGHT', _ascii(info['copyright'])),
+        ('CHARSET_REGISTRY', 'ISO10646'),
+        ('CHARSET_ENCODING', '1'),
+        ('SPACING', 'P'),
+        ('PIXEL_SIZE', info['pixelSize']),
+        ('POINT_SIZE', info['pixelSize'] * 10),
+        ('RESOLUTION_X', 75),
+        ('RESOLUTION_Y', 75),
+        ('FONT_ASCENT', info['ascent']),
+        ('FONT_DESCENT', info['descent']),
+    )
+    strings = []
+    stringsLength = 0
+    records = []
+    for name, value in properties:
+        nameOffset = stringsLength
+        strings.append(name + '\0')
+        stringsLength += len(name) + 1
+        if isinstance(value, basestring):
+            records.append(struct.pack('>lBl', nameOffset, 1, stringsLength))
+            strings.append(value + '\0')
+            stringsLength += len(value) + 1
+        else:
+            records.append(struct.pack('>lBl', nameOffset, 0, value))
+    padding = '\0' * (-len(records) % 4)
+    return struct.pack('<L', PCF_FORMAT) + struct.pack('>l', len(records)) + ''.join(records) \
+        + padding + struct.pack('>l', stringsLength) + ''.join(strings)
+
+def _pcfBitmaps(glyphs):
+    offsets = []
+    data = []
+    length = 0
+    for glyph in glyphs:
+        offsets.append(length)
+        for row in _hexRows(glyph['rows']):
+            row = row.decode('hex')
+            row += '\0' * (-len(row) % 4)
+            data.append(row)
+            length += len(row)
+    #the sizes of the bitmap data for each of the 4 possible paddings, only the one in use is written
+    sizes = [0, 0, length, 0]
+    return struct.pack('<L', PCF_FORMAT) + struct.pack('>l', len(glyphs)) \
+        + struct.pack('>%dl' % len(glyphs), *offsets) + struct.pack('>4l', *sizes) + ''.join(data)
+
+def _pcfEncodings(glyphs):
+    indexes = {}
+    for index, glyph in enumerate(glyphs):
+        if glyph['unicode'] <= 0xFFFF:
+            indexes[glyph['unicode']] = index
+    if not indexes:
+        indexes[0] = 0xFFFF
+    minByte1, maxByte1 = min(indexes) >> 8, max(indexes) >> 8
+    minByte2, maxByte2 = min([u & 0xFF for u in indexes]), max([u & 0xFF for u in indexes])
+    table = []
+    for byte1 in xrange(minByte1, maxByte1 + 1):
+        for byte2 in xrange(minByte2, maxByte2 + 1):
+            table.append(indexes.get((byte1 << 8) | byte2, 0xFFFF))
+    return struct.pack('<L', PCF_FORMAT) + struct.pack('>5h', minByte2, maxByte2, minByte1, maxByte1, 0) \
+        + struct.pack('>%dH' % len(table), *table)
+
+def _pcfGlyphNames(glyphs):
+    offsets = []
+    strings = []
+    length = 0
+    for glyph in glyphs:
+        offsets.append(length)
+        strings.append(glyph['name'] + '\0')
+        length += len(glyph['name']) + 1
+    return struct.pack('<L', PCF_FORMAT) + struct.pack('>l', len(glyphs)) \
+        + struct.pack('>%dl' % len(glyphs), *offsets) + struct.pack('>l', length) + ''.join(strings)
+
+def buildPCF(info, glyphs):
+    """Return the binary data of a Portable Compiled Format (PCF) font."""
+    metrics = [_pcfMetrics(g['metrics']) for g in glyphs]
+    swidths = [g['metrics'][4] * 72000 // (info['pixelSize'] * 75) for g in glyphs]
+    accelerators = _pcfAccelerators(info, glyphs)
+    tables = (
+        (PCF_PROPERTIES, _pcfProperties(info)),
+        (PCF_ACCELERATORS, accelerators),
+        (PCF_METRICS, struct.pack('<L', PCF_FORMAT) + struct.pack('>l', len(metrics))
+            + ''.join([struct.pack('>6h', *m) for m in metrics])),
+        (PCF_BITMAPS, _pcfBitmaps(glyphs)),
+        (PCF_BDF_ENCODINGS, _pcfEncodings(glyphs)),
+        (PCF_SWIDTHS, struct.pack('<L', PCF_FORMAT) + struct.pack('>l', len(swidths))
+            + struct.pack('>%dl' % len(swidths), *swidths)),
+        (PCF_GLYPH_NAMES, _pcfGlyphNames(glyphs)),
+        (PCF_BDF_ACCELERATORS, accelerators),
+    )
+    toc = []
+    body = []
+    offset = 8 + 16 * len(tables)
+    for tableType, data in tables:
+        toc.append(struct.pack('<llll', tableType, PCF_FORMAT, len(data), offset))
+        data += '\0' * (-len(data) % 4)
+        body.append(data)
+        offset += len(data)
+    return '\1fcp' + struct.pack('<l', len(tables)) + ''.join(toc) + ''.join(body)
+
+def buildPSF2(info, glyphs):
+    """
+    Return the binary data of a PC Screen Font version 2 (PSF2) with a unicode table.
+
+    PSF2 is a fixed cell format, all glyphs are placed on their baseline in a
+    cell that is as wide as the widest advance and as high as ascent and descent.
+    Pixels outside of the cell are cut off.
+
+    """
+    cellWidth = max([g['metrics'][4] for g in glyphs] + [1])
+    cellHeight = info['ascent'] + info['descent']
+    rowBytes = (cellWidth + 7) // 8
+    bitmaps = []
+    unicodeTable = []
+    for glyph in glyphs:
+        height, width, bearingX, bearingY, advance = glyph['metrics']
+        cell = [[False] * cellWidth for i in xrange(cellHeight)]
+        for y, row in enumerate(glyph['rows']):
+            cellY = info['ascent'] - bearingY + y
+            if cellY < 0 or cellY >= cellHeight: continue
+            for x, pixel in enumerate(row):
+                cellX = bearingX + x
+                if pixel and 0 <= cellX < cellWidth:
+                    cell[cellY][cellX] = True
+        bitmaps.append(''.join([row.decode('hex') for row in _hexRows(cell)]))
+        unicodeTable.append(unichr(glyph['unicode']).encode('utf-8') + '\xff')
+    header = struct.pack('<4sLLLLLLL', '\x72\xb5\x4a\x86', 0, 32, 0x01, len(glyphs),
+        rowBytes * cellHeight, cellHeight, cellWidth)
+    return header + ''.join(bitmaps) + ''.join(unicodeTable)
+
+def buildBitmapFont(fileFormat, info, glyphs):
+    """Return the data of fileFormat, one of bitmapFormats."""
+    return {'bdf' : buildBDF, 'pcf' : buildPCF, 'psf' : buildPSF2}[fileFormat](info, glyphs)
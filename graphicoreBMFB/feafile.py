@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""Write the features of a font as a file in the OpenType feature file syntax (.fea)."""
+#    This file is part of graphicore Bitmap Font Building.
+#
+#    graphicore Bitmap Font Building, this program builds bitmap fonts
+#    Copyright (c) 2010, Lasse Fister lasse@graphicore.de, http://graphicore.de
+#
+#    graphicore Bitmap Font Building is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The file is plain feature syntax, so besides fontforge (mergeFeature) any
+# feature compiler (makeotf, fontTools feaLib) can build the GSUB and GPOS
+# tables from it. The features have no script or language statements, they
+# are registered for all the languagesystems of the file.
+
+from __future__ import with_statement
+
+import os
+
+#glyph names that are keywords of the feature syntax must be escaped with a backslash
+keywords = frozenset(('anchor', 'anchorDef', 'anon', 'anonymous', 'by', 'contour', 'cursive', 'device',
+    'enum', 'enumerate', 'exclude_dflt', 'feature', 'from', 'ignore', 'IgnoreBaseGlyphs',
+    'IgnoreLigatures', 'IgnoreMarks', 'include', 'include_dflt', 'language', 'languagesystem',
+    'lookup', 'lookupflag', 'mark', 'MarkAttachmentType', 'markClass', 'nameid', 'NULL',
+    'parameters', 'pos', 'position', 'required', 'RightToLeft', 'reversesub', 'rsub', 'script',
+    'sub', 'substitute', 'subtable', 'table', 'useExtension', 'UseMarkFilteringSet',
+    'valueRecordDef', 'excludeDFLT', 'includeDFLT'))
+
+def glyphName(name):
+    """Return name as glyph name of the feature syntax."""
+    return u'\\' + name if name in keywords else name
+
+def render(languagesystems, classes, kern, substitutions):
+    """
+    Return the feature file as unicode.
+
+    languagesystems is a list of (script, language), classes a list of
+    (class name, list of glyph names), kern a list of (first class name,
+    second class name, value in em units) and substitutions a list of
+    (feature tag, list of (list of glyph names, glyph name)), the ligatures
+    of each feature.
+
+    """
+    lines = [u'# generated by graphicore Bitmap Font Building', u'']
+    for script, language in languagesystems:
+        lines.append(u'languagesystem {0} {1};'.format(script, language))
+    lines.append(u'')
+    for className, names in classes:
+        lines.append(u'{0} = [{1}];'.format(className, u' '.join([glyphName(name) for name in names])))
+    if classes:
+        lines.append(u'')
+    for featureTag, ligatures in substitutions:
+        if not ligatures: continue
+        lines.append(u'feature {0} {{'.format(featureTag))
+        for sub, by in ligatures:
+            lines.append(u'    sub {0} by {1};'.format(u' '.join([glyphName(name) for name in sub]), glyphName(by)))
+        lines.append(u'}} {0};'.format(featureTag))
+        lines.append(u'')
+    if kern:
+        lines.append(u'feature kern {')
+        for first, second, value in kern:
+            lines.append(u'    pos {0} {1} {2};'.format(first, second, value))
+        lines.append(u'} kern;')
+        lines.append(u'')
+    return u'\n'.join(lines)
+
+def writeFeatureFile(fileName, text):
+    """
+    Write the unicode text of render to fileName, utf-8 encoded.
+
+    The text is written to a temporary file next to fileName, that is then
+    renamed to fileName, so other builds never read a partial file.
+
+    """
+    tempName = '%s.%d.tmp' % (fileName, os.getpid())
+    with open(tempName, 'wb') as file:
+        file.write(text.encode('utf-8'))
+    os.rename(tempName, fileName)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""A single file archive of glyph bitmaps, an alternative to a folder of glyph .txt files."""
+#    This file is part of graphicore Bitmap Font Building.
+#
+#    graphicore Bitmap Font Building, this program builds bitmap fonts
+#    Copyright (c) 2010, Lasse Fister lasse@graphicore.de, http://graphicore.de
+#
+#    graphicore Bitmap Font Building is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The layout of an archive, all numbers are big-endian:
+#   header: 'BMFA', version uint16, count of entries uint32
+#   index: for each entry
+#       length of the name uint16, the name utf-8 encoded,
+#       offset of the bitmap from the start of the file uint32,
+#       count of rows uint16, width uint16 (the length of the longest row)
+#   bitmaps: each row bit-packed, most significant bit first, padded to whole bytes
+# An entry has the name of the glyph file it replaces, so the "glyphs" dict
+# of the options is the same for a folder and an archive.
+
+from __future__ import with_statement
+
+import mmap
+import struct
+
+class ArchiveError(Exception): pass
+
+magic = 'BMFA'
+version = 1
+
+def _packRow(row, rowBytes):
+    value = 0
+    for pixel in row:
+        value = (value << 1) | (1 if pixel else 0)
+    value <<= rowBytes * 8 - len(row)
+    return ''.join([chr((value >> shift) & 0xFF) for shift in xrange((rowBytes - 1) * 8, -1, -8)])
+
+def writeArchive(fileName, entries):
+    """
+    Write an archive with entries to fileName.
+
+    entries is a list of tuples (name, rows), rows is a list of rows, each a
+    list of booleans. Rows shorter than the longest row are padded with empty pixels.
+
+    """
+    entries = sorted(entries)
+    index = []
+    bitmaps = []
+    offset = 10 + sum([2 + len(name.encode('utf-8')) + 8 for name, rows in entries])
+    for name, rows in entries:
+        width = max([len(row) for row in rows] + [0])
+        rowBytes = (width + 7) // 8
+        encoded = name.encode('utf-8')
+        index.append(struct.pack('>H', len(encoded)) + encoded + struct.pack('>LHH', offset, len(rows), width))
+        bitmap = ''.join([_packRow(row, rowBytes) for row in rows])
+        bitmaps.append(bitmap)
+        offset += len(bitmap)
+    with open(fileName, 'wb') as file:
+        file.write(struct.pack('>4sHL', magic, version, len(entries)))
+        file.write(''.join(index))
+        file.write(''.join(bitmaps))
+    return len(entries)
+
+def isArchive(fileName):
+    """Return True if fileName is a glyph archive."""
+    with open(fileName, 'rb') as file:
+        return file.read(4) == magic
+
+class GlyphArchive(object):
+    """
+    Read access to the glyphs of an archive.
+
+    The file is mapped into memory once and the index is read when opening,
+    getting the rows of a glyph needs no further system calls.
+
+    """
+    def __init__(self, fileName):
+        self.fileName = fileName
+        self._file = open(fileName, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+        fileMagic, fileVersion, count = struct.unpack('>4sHL', self._map[:10])
+        if fileMagic != magic:
+            self.close()
+            raise ArchiveError('{0} is not a glyph archive'.format(fileName))
+        if fileVersion > version:
+            self.close()
+            raise ArchiveError('{0} has version {1}, only up to version {2} can be read'.format(fileName, fileVersion, version))
+        self.index = {}
+        position = 10
+        for i in xrange(count):
+            length = struct.unpack('>H', self._map[position:position + 2])[0]
+            name = self._map[position + 2:position + 2 + length].decode('utf-8')
+            position += 2 + length
+            self.index[name] = struct.unpack('>LHH', self._map[position:position + 8])
+            position += 8
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def names(self):
+        return sorted(self.index.keys())
+
+    def getRows(self, name):
+        """Return the rows of the entry name, each a list of booleans."""
+        try:
+            offset, rowCount, width = self.index[name]
+        except KeyError:
+            raise ArchiveError('{0} is not in {1}'.format(name, self.fileName))
+        rowBytes = (width + 7) // 8
+        rows = []
+        for y in xrange(rowCount):
+            value = 0
+            for byte in self._map[offset + y * rowBytes:offset + (y + 1) * rowBytes]:
+                value = (value << 8) | ord(byte)
+            shift = rowBytes * 8 - 1
+            rows.append([bool((value >> (shift - x)) & 1) for x in xrange(width)])
+        return rows
+
+    def close(self):
+        self._map.close()
+        self._file.close()
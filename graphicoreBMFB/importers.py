@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""Read glyph bitmaps from other sources: BDF fonts and PNG sprite sheets."""
+#    This file is part of graphicore Bitmap Font Building.
+#
+#    graphicore Bitmap Font Building, this program builds bitmap fonts
+#    Copyright (c) 2010, Lasse Fister lasse@graphicore.de, http://graphicore.de
+#
+#    graphicore Bitmap Font Building is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Everything here is read as a stream, one glyph (or one row of cells of a
+# sprite sheet) at a time, so the memory used does not grow with the source.
+
+import struct
+import zlib
+
+class SourceError(Exception): pass
+
+def readBDF(file):
+    """
+    Yield each glyph of the BDF font in the open file as dict.
+
+    The keys are:
+        name: from STARTCHAR, encoding: from ENCODING, -1 if not encoded
+        advance: the x of DWIDTH
+        box: the BBX (width, height, xOffset, yOffset) of the bitmap
+        rows: a list of height rows, each a list of width booleans
+
+    """
+    glyph = None
+    bitmap = None
+    for line in file:
+        words = line.split()
+        if not words: continue
+        keyword = words[0]
+        if keyword == 'STARTCHAR':
+            glyph = {'name' : ' '.join(words[1:]), 'encoding' : -1, 'advance' : 0, 'box' : (0, 0, 0, 0)}
+        elif glyph is None:
+            continue
+        elif bitmap is not None:
+            if keyword == 'ENDCHAR':
+                width = glyph['box'][0]
+                glyph['rows'] = [[bool(int(hexRow, 16) >> (len(hexRow) * 4 - 1 - x) & 1) for x in xrange(width)]
+                    for hexRow in bitmap]
+                yield glyph
+                glyph = bitmap = None
+            else:
+                bitmap.append(keyword)
+        elif keyword == 'ENCODING':
+            glyph['encoding'] = int(words[1])
+        elif keyword == 'DWIDTH':
+            glyph['advance'] = int(words[1])
+        elif keyword == 'BBX':
+            glyph['box'] = tuple([int(word) for word in words[1:5]])
+        elif keyword == 'BITMAP':
+            bitmap = []
+
+def _paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    if pb <= pc:
+        return b
+    return c
+
+def readPNG(file):
+    """
+    Return a tuple (width, height, rows) for the PNG image in the open binary file.
+
+    rows is an iterator that yields each row of the image as a list of
+    (gray, alpha) tuples with values from 0 to 255. The image data is
+    decompressed and unfiltered row by row. Interlaced images are not supported.
+
+    """
+    if file.read(8) != '\x89PNG\r\n\x1a\n':
+        raise SourceError('not a PNG file')
+    palette = []
+    transparency = ''
+    header = None
+    while True:
+        length, chunkType = struct.unpack('>L4s', file.read(8))
+        if chunkType == 'IDAT':
+            #stop here, the image data is read lazily by the rows iterator
+            break
+        data = file.read(length)
+        file.read(4)#crc
+        if chunkType == 'IHDR':
+            header = struct.unpack('>LLBBBBB', data)
+        elif chunkType == 'PLTE':
+            palette = [struct.unpack('BBB', data[i:i + 3]) for i in xrange(0, len(data), 3)]
+        elif chunkType == 'tRNS':
+            transparency = data
+        elif chunkType == 'IEND':
+            raise SourceError('PNG without image data')
+    width, height, depth, colorType, compression, filterMethod, interlace = header
+    if interlace:
+        raise SourceError('interlaced PNGs are not supported')
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}[colorType]
+    bitsPerPixel = channels * depth
+    bytesPerPixel = max(1, bitsPerPixel // 8)
+    rowLength = (width * bitsPerPixel + 7) // 8
+
+    def idat(length):
+        #yield the data of all consecutive IDAT chunks
+        while True:
+            yield file.read(length)
+            file.read(4)#crc
+            length, chunkType = struct.unpack('>L4s', file.read(8))
+            if chunkType != 'IDAT':
+                return
+
+    def samples(row):
+        if depth == 8:
+            return [ord(byte) for byte in row]
+        if depth == 16:
+            return [value >> 8 for value in struct.unpack('>%dH' % (len(row) // 2), row)]
+        mask = (1 << depth) - 1
+        result = []
+        for byte in row:
+            byte = ord(byte)
+            for shift in xrange(8 - depth, -1, -depth):
+                result.append((byte >> shift) & mask)
+        return result[:width * channels]
+
+    def pixel(values):
+        if colorType == 3:
+            r, g, b = palette[values[0]]
+            alpha = ord(transparency[values[0]]) if values[0] < len(transparency) else 255
+            return ((r * 299 + g * 587 + b * 114) // 1000, alpha)
+        if depth < 8:
+            #scale to 0-255
+            values = [value * 255 // ((1 << depth) - 1) for value in values]
+        if colorType == 0:
+            return (values[0], 255)
+        if colorType == 4:
+            return (values[0], values[1])
+        alpha = values[3] if colorType == 6 else 255
+        return ((values[0] * 299 + values[1] * 587 + values[2] * 114) // 1000, alpha)
+
+    def rows(firstLength):
+        decompressor = zlib.decompressobj()
+        buffer = ''
+        previous = [0] * rowLength
+        produced = 0
+        for data in idat(firstLength):
+            buffer += decompressor.decompress(data)
+            while len(buffer) > rowLength and produced < height:
+                filterType = ord(buffer[0])
+                current = [ord(byte) for byte in buffer[1:rowLength + 1]]
+                buffer = buffer[rowLength + 1:]
+                for i in xrange(rowLength):
+                    left = current[i - bytesPerPixel] if i >= bytesPerPixel else 0
+                    upperLeft = previous[i - bytesPerPixel] if i >= bytesPerPixel else 0
+                    if filterType == 1:
+                        current[i] = (current[i] + left) & 0xFF
+                    elif filterType == 2:
+                        current[i] = (current[i] + previous[i]) & 0xFF
+                    elif filterType == 3:
+                        current[i] = (current[i] + ((left + previous[i]) >> 1)) & 0xFF
+                    elif filterType == 4:
+                        current[i] = (current[i] + _paeth(left, previous[i], upperLeft)) & 0xFF
+                previous = current
+                produced += 1
+                values = samples(''.join([chr(byte) for byte in current]))
+                yield [pixel(values[x * channels:(x + 1) * channels]) for x in xrange(width)]
+
+    return (width, height, rows(length))
+
+def sliceSheet(width, height, rows, grid):
+    """
+    Yield (index, cell) for each cell of a sprite sheet, row by row, left to right.
+
+    width, height and rows are as returned by readPNG. cell is a list of
+    grid['cellHeight'] rows, each a list of grid['cellWidth'] booleans.
+    grid is a dict with the keys:
+        cellWidth, cellHeight: the size of one cell in pixels
+        left, top: the position of the first cell in the sheet [default: 0]
+        spacingX, spacingY: the space between two cells [default: 0]
+        threshold: pixels with a gray value below are filled [default: 128]
+        invert: if True pixels above the threshold are filled [default: False]
+    Pixels with an alpha value below 128 are always empty.
+    Only one row of cells is held in memory at a time.
+
+    """
+    cellWidth = grid['cellWidth']
+    cellHeight = grid['cellHeight']
+    left = grid.get('left', 0)
+    top = grid.get('top', 0)
+    spacingX = grid.get('spacingX', 0)
+    spacingY = grid.get('spacingY', 0)
+    threshold = grid.get('threshold', 128)
+    invert = grid.get('invert', False)
+    columns = (width - left + spacingX) // (cellWidth + spacingX)
+    def isFilled(pixel):
+        gray, alpha = pixel
+        return alpha >= 128 and ((gray >= threshold) if invert else (gray < threshold))
+    index = 0
+    band = []
+    for y, row in enumerate(rows):
+        if y < top: continue
+        positionInBand = (y - top) % (cellHeight + spacingY)
+        if positionInBand >= cellHeight: continue
+        band.append([isFilled(pixel) for pixel in row])
+        if len(band) < cellHeight: continue
+        for column in xrange(columns):
+            x = left + column * (cellWidth + spacingX)
+            yield (index, [line[x:x + cellWidth] for line in band])
+            index += 1
+        band = []
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""Run the builds of many fonts in parallel processes, the longest first, as expected from the durations of earlier builds."""
+#    This file is part of graphicore Bitmap Font Building.
+#
+#    graphicore Bitmap Font Building, this program builds bitmap fonts
+#    Copyright (c) 2010, Lasse Fister lasse@graphicore.de, http://graphicore.de
+#
+#    graphicore Bitmap Font Building is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The builds of a family are independent of each other, so the time of the
+# whole run is at least the longest build and at least the sum of all builds
+# divided by the count of workers. Starting the longest builds first (LPT)
+# keeps the run close to that bound, it only works with good expectations:
+# the history keeps the last durations of each build, a build without history
+# is expected to take as long as the builds with the same signature (the
+# options that make drawing slow or fast).
+
+from __future__ import with_statement
+
+import os
+import json
+import time
+import subprocess
+
+#the count of durations kept in the history for each build
+keep = 5
+
+def loadHistory(fileName):
+    """Return the history in fileName, a dict of key : {'signature' : signature, 'seconds' : [durations]}, an empty dict if there is no file."""
+    if not os.path.exists(fileName):
+        return {}
+    with open(fileName, 'rb') as file:
+        return json.load(file)
+
+def writeHistory(fileName, history):
+    """Write history to fileName, the file is replaced at once, so an interrupted run never leaves half of it."""
+    tempName = '%s.%d.tmp' % (fileName, os.getpid())
+    with open(tempName, 'wb') as file:
+        json.dump(history, file, sort_keys = True, indent = 1)
+    os.rename(tempName, fileName)
+
+def recordDuration(history, key, signature, seconds):
+    """Add the duration of the build key to history, only the last durations are kept."""
+    entry = history.setdefault(key, {'seconds' : []})
+    entry['signature'] = signature
+    entry['seconds'] = (entry['seconds'] + [round(seconds, 3)])[-keep:]
+
+def getExpected(history, signatures):
+    """
+    Return a dict of key : expected seconds for each key of the dict signatures (key : signature).
+
+    A build with history is expected to take the mean of its durations,
+    others the mean of the builds with the same signature, or of all builds
+    in the history, or 1 second if the history is empty.
+
+    """
+    means = dict([(key, sum(entry['seconds']) / len(entry['seconds'])) for key, entry in history.iteritems() if entry['seconds']])
+    bySignature = {}
+    for key, mean in means.iteritems():
+        bySignature.setdefault(history[key].get('signature'), []).append(mean)
+    overall = sum(means.values()) / len(means) if means else 1.0
+    expected = {}
+    for key, signature in signatures.iteritems():
+        if key in means:
+            expected[key] = means[key]
+        elif signature in bySignature:
+            expected[key] = sum(bySignature[signature]) / len(bySignature[signature])
+        else:
+            expected[key] = overall
+    return expected
+
+def getOrder(expected):
+    """Return the keys of expected, the longest first."""
+    return sorted(expected, key = lambda key: (-expected[key], key))
+
+def simulate(durations, order, workers):
+    """Return the time the builds of order take with workers, each build starts on the first free worker."""
+    free = [0.0] * max(1, workers)
+    for key in order:
+        index = free.index(min(free))
+        free[index] += durations[key]
+    return max(free)
+
+def run(commands, order, workers, logs, poll = 0.05):
+    """
+    Run the commands (key : argument list) in order with at most workers processes at a time.
+
+    The output of each command goes to the file logs[key], so the outputs
+    of parallel builds don't mix. Return a dict of key : {'seconds', 'start',
+    'worker', 'returncode'}, start is the time since the first build started.
+
+    """
+    pending = list(order)
+    running = {}#worker : (key, process, log file, start)
+    results = {}
+    begin = time.time()
+    try:
+        while pending or running:
+            for worker in xrange(max(1, workers)):
+                if worker not in running and pending:
+                    key = pending.pop(0)
+                    log = open(logs[key], 'wb')
+                    try:
+                        process = subprocess.Popen(commands[key], stdout = log, stderr = subprocess.STDOUT)
+                    except:
+                        log.close()
+                        raise
+                    running[worker] = (key, process, log, time.time())
+            for worker, (key, process, log, start) in running.items():
+                returncode = process.poll()
+                if returncode is None: continue
+                end = time.time()
+                log.close()
+                results[key] = {'seconds' : round(end - start, 3), 'start' : round(start - begin, 3), 'worker' : worker, 'returncode' : returncode}
+                del running[worker]
+            if running:
+                time.sleep(poll)
+    finally:
+        #only if something went wrong (or the run was interrupted), the builds still running are stopped
+        for key, process, log, start in running.values():
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+            log.close()
+    return results
+
+def getReport(expected, results, order, workers):
+    """
+    Return a dict comparing the expected and the actual times of a run.
+
+    total is the time of the whole run, bound the shortest possible time of
+    the run: the longest build or the sum of all builds divided by workers,
+    whichever is longer. utilization is the part of the time of all workers
+    that was spent building, efficiency is bound / total. bound, longest
+    and utilization are of the successful builds only, a build that failed
+    early would make them look better than they are, the failed builds are
+    listed in "failed".
+
+    """
+    failed = sorted([key for key, result in results.iteritems() if result['returncode'] != 0])
+    actual = dict([(key, result['seconds']) for key, result in results.iteritems() if key not in failed])
+    total = max([result['start'] + result['seconds'] for result in results.itervalues()] + [0])
+    busy = sum(actual.values())
+    bound = max(actual.values() + [busy / max(1, workers)])
+    builds = []
+    for key in order:
+        entry = {'name' : key, 'expected' : round(expected[key], 3)}
+        entry.update(results.get(key, {}))
+        builds.append(entry)
+    return {
+        'workers' : workers,
+        'expectedTotal' : round(simulate(expected, order, workers), 3),
+        'total' : round(total, 3),
+        'bound' : round(bound, 3),
+        'longest' : max(actual, key = actual.get) if actual else None,
+        'utilization' : round(busy / (total * max(1, workers)), 4) if total else 0,
+        'efficiency' : round(bound / total, 4) if total else 0,
+        'failed' : failed,
+        'builds' : builds,
+    }
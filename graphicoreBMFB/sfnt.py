@@ -0,0 +1,438 @@
+# -*- coding: utf-8 -*-
+"""Read and write the binary table structure of sfnt fonts (OpenType, TrueType) and wrap them as WOFF and WOFF2."""
+#    This file is part of graphicore Bitmap Font Building.
+#
+#    graphicore Bitmap Font Building, this program builds bitmap fonts
+#    Copyright (c) 2010, Lasse Fister lasse@graphicore.de, http://graphicore.de
+#
+#    graphicore Bitmap Font Building is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import with_statement
+
+import struct
+import zlib
+
+#brotli is only needed for woff2, everything else works without it
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+class SFNTError(Exception): pass
+
+#the formats fontforge generates with a table structure that can be read and written here
+sfntFormats = ('otf', 'ttf')
+
+#the formats that are made by wrapping the tables of an already compiled sfnt
+webFormats = ('woff', 'woff2')
+
+#see: http://www.w3.org/TR/WOFF2/#table_dir_format the index in this tuple is the "known table tag" of woff2
+woff2KnownTags = (
+    'cmap', 'head', 'hhea', 'hmtx', 'maxp', 'name', 'OS/2', 'post', 'cvt ',
+    'fpgm', 'glyf', 'loca', 'prep', 'CFF ', 'VORG', 'EBDT', 'EBLC', 'gasp',
+    'hdmx', 'kern', 'LTSH', 'PCLT', 'VDMX', 'vhea', 'vmtx', 'BASE', 'GDEF',
+    'GPOS', 'GSUB', 'EBSC', 'JSTF', 'MATH', 'CBDT', 'CBLC', 'COLR', 'CPAL',
+    'SVG ', 'sbix', 'acnt', 'avar', 'bdat', 'bloc', 'bsln', 'cvar', 'fdsc',
+    'feat', 'fmtx', 'fvar', 'gvar', 'hsty', 'just', 'lcar', 'mort', 'morx',
+    'opbd', 'prop', 'trak', 'Zapf', 'Silf', 'Glat', 'Gloc', 'Feat', 'Sill'
+)
+
+def _pad4(data):
+    """Return data padded with zeros to a length that is a multiple of 4."""
+    return data + '\0' * (-len(data) % 4)
+
+def calcChecksum(data):
+    """Return the sfnt checksum of data, the sum of all big-endian uint32 in it."""
+    data = _pad4(data)
+    return sum(struct.unpack('>%dL' % (len(data) // 4), data)) & 0xFFFFFFFF
+
+def readSFNT(data):
+    """Return a tuple of the flavor (sfnt version) and a dict of tag : tabledata from the binary sfnt data."""
+    flavor, numTables = struct.unpack('>4sH', data[:6])
+    tables = {}
+    for i in xrange(numTables):
+        entry = 12 + i * 16
+        tag, checksum, offset, length = struct.unpack('>4sLLL', data[entry:entry + 16])
+        tables[tag] = data[offset:offset + length]
+    return (flavor, tables)
+
+def readSFNTFile(fileName):
+    """Return the result of readSFNT() for the file fileName."""
+    with open(fileName, 'rb') as file:
+        return readSFNT(file.read())
+
+def _searchValues(numTables):
+    """Return searchRange, entrySelector and rangeShift for numTables, used in the sfnt header."""
+    entrySelector = 0
+    while (2 << entrySelector) <= numTables:
+        entrySelector += 1
+    searchRange = (1 << entrySelector) * 16
+    return (searchRange, entrySelector, numTables * 16 - searchRange)
+
+def writeSFNT(flavor, tables):
+    """
+    Return binary sfnt data for flavor and the dict tables.
+
+    The checkSumAdjustment in the head table is recalculated, so tables
+    may have been changed, added or removed after readSFNT().
+
+    """
+    tags = sorted(tables.keys())
+    tables = dict(tables)
+    if 'head' in tables:
+        #checkSumAdjustment must be zero while calculating the checksums
+        tables['head'] = tables['head'][:8] + '\0\0\0\0' + tables['head'][12:]
+    header = [struct.pack('>4sHHHH', flavor, len(tags), *_searchValues(len(tags)))]
+    body = []
+    offset = 12 + 16 * len(tags)
+    for tag in tags:
+        data = tables[tag]
+        header.append(struct.pack('>4sLLL', tag, calcChecksum(data), offset, len(data)))
+        data = _pad4(data)
+        body.append(data)
+        offset += len(data)
+    result = ''.join(header + body)
+    if 'head' in tables:
+        adjustment = (0xB1B0AFBA - calcChecksum(result)) & 0xFFFFFFFF
+        headOffset = struct.unpack('>L', header[tags.index('head') + 1][8:12])[0]
+        result = result[:headOffset + 8] + struct.pack('>L', adjustment) + result[headOffset + 12:]
+    return result
+
+def _sfntSize(tables):
+    """Return the size of an uncompressed sfnt containing tables."""
+    return 12 + 16 * len(tables) + sum([len(_pad4(data)) for data in tables.itervalues()])
+
+def _fontVersion(tables):
+    """Return the major and minor version of the font from the head table, for the woff header."""
+    if 'head' not in tables:
+        return (0, 0)
+    return struct.unpack('>HH', tables['head'][4:8])
+
+def writeWOFF(flavor, tables, level = 9):
+    """Return binary WOFF 1.0 data of the sfnt tables, compressed with zlib at level."""
+    tags = sorted(tables.keys())
+    directory = []
+    body = []
+    offset = 44 + 20 * len(tags)
+    for tag in tags:
+        data = tables[tag]
+        compressed = zlib.compress(data, level)
+        #tables that don't get smaller are stored uncompressed
+        if len(compressed) >= len(data):
+            compressed = data
+        directory.append(struct.pack('>4sLLLL', tag, offset, len(compressed), len(data), calcChecksum(data)))
+        compressed = _pad4(compressed)
+        body.append(compressed)
+        offset += len(compressed)
+    header = struct.pack('>4s4sLHHLHHLLLLL', 'wOFF', flavor, offset, len(tags), 0,
+        _sfntSize(tables), _fontVersion(tables)[0], _fontVersion(tables)[1], 0, 0, 0, 0, 0)
+    return ''.join([header] + directory + body)
+
+def _uIntBase128(value):
+    """Return value encoded as UIntBase128, the variable length integer of woff2."""
+    result = [value & 0x7F]
+    value >>= 7
+    while value:
+        result.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return ''.join([chr(byte) for byte in reversed(result)])
+
+def writeWOFF2(flavor, tables, quality = 11):
+    """
+    Return binary WOFF 2.0 data of the sfnt tables, compressed with brotli at quality.
+
+    glyf and loca are stored with the null transform, so the tables are used as
+    compiled, no outline data is changed.
+
+    """
+    if brotli is None:
+        raise SFNTError('woff2 needs the brotli module, it could not be imported')
+    tags = sorted(tables.keys())
+    #loca must follow glyf directly
+    if 'glyf' in tags and 'loca' in tags:
+        tags.remove('loca')
+        tags.insert(tags.index('glyf') + 1, 'loca')
+    directory = []
+    for tag in tags:
+        #transformation version 3 is the null transform for glyf and loca, version 0 for all others
+        transform = 0xC0 if tag in ('glyf', 'loca') else 0x00
+        if tag in woff2KnownTags:
+            directory.append(chr(transform | woff2KnownTags.index(tag)))
+        else:
+            directory.append(chr(transform | 0x3F) + tag)
+        directory.append(_uIntBase128(len(tables[tag])))
+    directory = ''.join(directory)
+    compressed = brotli.compress(''.join([tables[tag] for tag in tags]), mode = brotli.MODE_FONT, quality = quality)
+    length = len(_pad4(''.join(('\0' * 48, directory, compressed))))
+    header = struct.pack('>4s4sLHHLLHHLLLLL', 'wOF2', flavor, length, len(tags), 0,
+        _sfntSize(tables), len(compressed), _fontVersion(tables)[0], _fontVersion(tables)[1], 0, 0, 0, 0, 0)
+    return _pad4(''.join((header, directory, compressed)))
+
+def writeWebFont(fileName, fileFormat, flavor, tables, level):
+    """Write the sfnt tables as fileFormat (one of webFormats) to fileName."""
+    if fileFormat == 'woff':
+        data = writeWOFF(flavor, tables, level)
+    elif fileFormat == 'woff2':
+        data = writeWOFF2(flavor, tables, level)
+    else:
+        raise SFNTError('{0} is not a web font format, use one of: {1}'.format(fileFormat, ', '.join(webFormats)))
+    with open(fileName, 'wb') as file:
+        file.write(data)
+    return len(data)
+
+def readCmap(data):
+    """
+    Return a dict of unicode : glyph index from the binary data of a cmap table.
+
+    Only the subtable formats 4 and 12 of the unicode encodings are read,
+    these are the ones fontforge writes.
+
+    """
+    version, numTables = struct.unpack('>HH', data[:4])
+    subtables = {}
+    for i in xrange(numTables):
+        platform, encoding, offset = struct.unpack('>HHL', data[4 + i * 8:12 + i * 8])
+        subtables[(platform, encoding)] = offset
+    for key in ((3, 10), (0, 4), (3, 1), (0, 3)):
+        if key in subtables:
+            offset = subtables[key]
+            break
+    else:
+        raise SFNTError('no unicode subtable found in the cmap')
+    fmt = struct.unpack('>H', data[offset:offset + 2])[0]
+    cmap = {}
+    if fmt == 4:
+        segCount = struct.unpack('>H', data[offset + 6:offset + 8])[0] // 2
+        arrays = offset + 14
+        ends = struct.unpack('>%dH' % segCount, data[arrays:arrays + segCount * 2])
+        starts = struct.unpack('>%dH' % segCount, data[arrays + segCount * 2 + 2:arrays + segCount * 4 + 2])
+        deltas = struct.unpack('>%dh' % segCount, data[arrays + segCount * 4 + 2:arrays + segCount * 6 + 2])
+        rangeOffsetsStart = arrays + segCount * 6 + 2
+        rangeOffsets = struct.unpack('>%dH' % segCount, data[rangeOffsetsStart:rangeOffsetsStart + segCount * 2])
+        for i in xrange(segCount):
+            for uni in xrange(starts[i], ends[i] + 1):
+                if uni == 0xFFFF: continue
+                if rangeOffsets[i] == 0:
+                    gid = (uni + deltas[i]) & 0xFFFF
+                else:
+                    position = rangeOffsetsStart + i * 2 + rangeOffsets[i] + (uni - starts[i]) * 2
+                    gid = struct.unpack('>H', data[position:position + 2])[0]
+                    if gid: gid = (gid + deltas[i]) & 0xFFFF
+                if gid: cmap[uni] = gid
+    elif fmt == 12:
+        numGroups = struct.unpack('>L', data[offset + 12:offset + 16])[0]
+        for i in xrange(numGroups):
+            position = offset + 16 + i * 12
+            start, end, startGid = struct.unpack('>LLL', data[position:position + 12])
+            for uni in xrange(start, end + 1):
+                cmap[uni] = startGid + uni - start
+    else:
+        raise SFNTError('cmap subtable format {0} is not supported'.format(fmt))
+    return cmap
+
+def numGlyphs(tables):
+    """Return the number of glyphs from the maxp table."""
+    return struct.unpack('>H', tables['maxp'][4:6])[0]
+
+def _readIndex(data, offset):
+    """Return a tuple of the list of the items of the CFF INDEX at offset in data and the offset after it."""
+    count = struct.unpack('>H', data[offset:offset + 2])[0]
+    if count == 0:
+        return ([], offset + 2)
+    offSize = ord(data[offset + 2])
+    offsets = []
+    for i in xrange(count + 1):
+        start = offset + 3 + i * offSize
+        value = 0
+        for byte in data[start:start + offSize]:
+            value = (value << 8) | ord(byte)
+        offsets.append(value)
+    #the offsets are relative to the byte before the object data
+    base = offset + 3 + (count + 1) * offSize - 1
+    return ([data[base + offsets[i]:base + offsets[i + 1]] for i in xrange(count)], base + offsets[-1])
+
+def _readDict(data):
+    """Return a dict of operator : list of operands of the binary CFF DICT data, two byte operators are (12, b1)."""
+    result = {}
+    operands = []
+    i = 0
+    while i < len(data):
+        b0 = ord(data[i])
+        if b0 <= 21:
+            operator = b0
+            if b0 == 12:
+                operator = (12, ord(data[i + 1]))
+                i += 1
+            result[operator] = operands
+            operands = []
+            i += 1
+        elif b0 == 28:
+            operands.append(struct.unpack('>h', data[i + 1:i + 3])[0])
+            i += 3
+        elif b0 == 29:
+            operands.append(struct.unpack('>l', data[i + 1:i + 5])[0])
+            i += 5
+        elif b0 == 30:
+            #real numbers are not needed here, skip the nibbles up to the end nibble 0xf
+            i += 1
+            while (ord(data[i]) & 0x0F) != 0x0F and (ord(data[i]) >> 4) != 0x0F:
+                i += 1
+            operands.append(0)
+            i += 1
+        elif b0 <= 246:
+            operands.append(b0 - 139)
+            i += 1
+        elif b0 <= 250:
+            operands.append((b0 - 247) * 256 + ord(data[i + 1]) + 108)
+            i += 2
+        elif b0 <= 254:
+            operands.append(-(b0 - 251) * 256 - ord(data[i + 1]) - 108)
+            i += 2
+        else:
+            raise SFNTError('invalid byte {0} in a CFF DICT'.format(b0))
+    return result
+
+def glyphSizes(tables):
+    """
+    Return a list of the size in bytes of the outline of each glyph, by glyph index.
+
+    For TrueType outlines this is the size of the glyph in the glyf table,
+    for CFF outlines the size of the charstring, without the subroutines it calls.
+
+    """
+    if 'glyf' in tables and 'loca' in tables:
+        longOffsets = struct.unpack('>h', tables['head'][50:52])[0]
+        count = numGlyphs(tables) + 1
+        if longOffsets:
+            offsets = struct.unpack('>%dL' % count, tables['loca'][:count * 4])
+        else:
+            offsets = [offset * 2 for offset in struct.unpack('>%dH' % count, tables['loca'][:count * 2])]
+        return [offsets[i + 1] - offsets[i] for i in xrange(count - 1)]
+    if 'CFF ' in tables:
+        data = tables['CFF ']
+        offset = ord(data[2])#header size
+        names, offset = _readIndex(data, offset)
+        topDicts, offset = _readIndex(data, offset)
+        charStrings = _readDict(topDicts[0])[17][0]
+        return [len(charString) for charString in _readIndex(data, charStrings)[0]]
+    raise SFNTError('the font has neither glyf and loca nor CFF outlines')
+
+def _packBits(rows):
+    """Return the rows (sequences of booleans) as bit-aligned binary data, the first pixel in the highest bit."""
+    result = []
+    byte = count = 0
+    for row in rows:
+        for pixel in row:
+            byte = (byte << 1) | (1 if pixel else 0)
+            count += 1
+            if count == 8:
+                result.append(chr(byte))
+                byte = count = 0
+    if count:
+        result.append(chr(byte << (8 - count)))
+    return ''.join(result)
+
+def _lineMetrics(metrics, ascender, descender):
+    """Return the binary sbitLineMetrics for a strike from the big metrics of its glyphs."""
+    #(height, width, bearingX, bearingY, advance)
+    if not len(metrics):
+        metrics = [(0, 0, 0, 0, 0)]
+    #the glyph metrics fit (fitsBigGlyphMetrics), values made of them may not
+    def clamp(value):
+        return max(-128, min(127, value))
+    return struct.pack('>bbBbbbbbbbbb',
+        ascender,
+        descender,
+        max([m[4] for m in metrics]),#widthMax
+        1, 0, 0,#caret slope numerator and denominator and caret offset: upright
+        min([m[2] for m in metrics]),#minOriginSB
+        clamp(min([m[4] - m[2] - m[1] for m in metrics])),#minAdvanceSB
+        max([m[3] for m in metrics]),#maxBeforeBL
+        clamp(min([m[3] - m[0] for m in metrics])),#minAfterBL
+        0, 0)
+
+def fitsBigGlyphMetrics(metrics):
+    """Return True if metrics (height, width, bearingX, bearingY, advance) fit into the bytes of bigGlyphMetrics."""
+    height, width, bearingX, bearingY, advance = metrics
+    return (0 <= height <= 255 and 0 <= width <= 255 and 0 <= advance <= 255
+        and -128 <= bearingX <= 127 and -128 <= bearingY <= 127)
+
+def buildBitmapTables(strikes):
+    """
+    Return a tuple of the binary EBDT and EBLC tables for strikes.
+
+    strikes is a list of dicts with the keys:
+        ppem: the pixels per em of the strike
+        ascender, descender: the line metrics of the strike in pixels
+        glyphs: a dict of glyph index : (metrics, rows) where metrics is a tuple
+            (height, width, bearingX, bearingY, advance) in pixels and rows is a
+            list of height rows, each a sequence of width booleans
+    Each strike is stored in one index subtable of format 1 and image format 7
+    (big metrics, bit-aligned data). Glyph indexes in the range of a strike
+    without an entry in glyphs have no bitmap, strikes without glyphs are left
+    out. Raise SFNTError if the metrics of a glyph don't fit, see fitsBigGlyphMetrics.
+
+    """
+    strikes = [strike for strike in strikes if strike['glyphs']]
+    ebdt = [struct.pack('>L', 0x00020000)]
+    ebdtLength = 4
+    sizeRecords = []
+    indexData = []
+    indexOffset = 8 + 48 * len(strikes)
+    for strike in strikes:
+        gids = sorted(strike['glyphs'].keys())
+        first, last = gids[0], gids[-1]
+        imageDataOffset = ebdtLength
+        offsets = []
+        for gid in xrange(first, last + 1):
+            offsets.append(ebdtLength - imageDataOffset)
+            if gid not in strike['glyphs']: continue
+            metrics, rows = strike['glyphs'][gid]
+            if not fitsBigGlyphMetrics(metrics):
+                raise SFNTError('the metrics {0} of glyph {1} at {2} ppem do not fit into a bitmap strike'.format(metrics, gid, strike['ppem']))
+            height, width, bearingX, bearingY, advance = metrics
+            data = struct.pack('>BBbbBbbB', height, width, bearingX, bearingY, advance,
+                -(width // 2), 0, strike['ascender'] - strike['descender']) + _packBits(rows)
+            ebdt.append(data)
+            ebdtLength += len(data)
+        offsets.append(ebdtLength - imageDataOffset)
+        subtable = struct.pack('>HHL', 1, 7, imageDataOffset) + struct.pack('>%dL' % len(offsets), *offsets)
+        #the IndexSubTableArray with one element followed by the subtable itself
+        index = struct.pack('>HHL', first, last, 8) + subtable
+        lineMetrics = _lineMetrics([m for m, rows in strike['glyphs'].itervalues()], strike['ascender'], strike['descender'])
+        sizeRecords.append(struct.pack('>LLLL', indexOffset, len(index), 1, 0)
+            + lineMetrics + lineMetrics
+            + struct.pack('>HHBBBb', first, last, strike['ppem'], strike['ppem'], 1, 0x01))
+        indexData.append(index)
+        indexOffset += len(index)
+    eblc = struct.pack('>LL', 0x00020000, len(strikes)) + ''.join(sizeRecords) + ''.join(indexData)
+    return (''.join(ebdt), eblc)
+
+def embedBitmapStrikes(fileName, getStrikes):
+    """
+    Add EBDT and EBLC tables to the sfnt file fileName.
+
+    getStrikes is called with a dict of unicode : glyph index of the font
+    and must return the strikes as described by buildBitmapTables(). Return
+    the count of strikes embedded, the file is not changed if none has glyphs.
+
+    """
+    flavor, tables = readSFNTFile(fileName)
+    strikes = [strike for strike in getStrikes(readCmap(tables['cmap'])) if strike['glyphs']]
+    if not strikes:
+        return 0
+    tables['EBDT'], tables['EBLC'] = buildBitmapTables(strikes)
+    with open(fileName, 'wb') as file:
+        file.write(writeSFNT(flavor, tables))
+    return len(strikes)
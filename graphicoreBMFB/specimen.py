@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""Rasterize the outlines drawn by a pen and write them as PNG and SVG, for specimens without a built font."""
+#    This file is part of graphicore Bitmap Font Building.
+#
+#    graphicore Bitmap Font Building, this program builds bitmap fonts
+#    Copyright (c) 2010, Lasse Fister lasse@graphicore.de, http://graphicore.de
+#
+#    graphicore Bitmap Font Building is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Affero General Public License as
+#    published by the Free Software Foundation, either version 3 of the
+#    License, or (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Affero General Public License for more details.
+#
+#    You should have received a copy of the GNU Affero General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# The pens take the coordinates of the generators (em units, y goes up) and
+# store them in pixels (y goes down) by multiplying with scale. Both, the
+# rasterizer and SVG, fill with the nonzero rule, the overlapping contours of
+# the pixel shapes are filled as their union without removing the overlap.
+
+from __future__ import with_statement
+
+import struct
+import zlib
+from xml.sax.saxutils import escape
+
+#count of straight lines a curve is made of for rasterizing
+curveSteps = 8
+
+def splitQuadratic(points):
+    """
+    Return the quadratic curve of points as a list of (off curve point, on curve point).
+
+    points are off curve points followed by the end, like qCurveTo of a pen.
+    Between two off curve points is the implied on curve point of TrueType,
+    the middle of both.
+
+    """
+    segments = []
+    for (x0, y0), (x1, y1) in zip(points[:-2], points[1:-1]):
+        segments.append(((x0, y0), ((x0 + x1) * 0.5, (y0 + y1) * 0.5)))
+    segments.append((points[-2], points[-1]))
+    return segments
+
+class PolygonPen(object):
+    """A pen that stores contours as polygons, a list of (x, y) in pixels, curves become curveSteps lines."""
+    def __init__(self, scale):
+        self.scale = scale
+        self.polygons = []
+        self._current = None
+
+    def _point(self, point):
+        return (point[0] * self.scale, -point[1] * self.scale)
+
+    def moveTo(self, point):
+        self._current = [self._point(point)]
+
+    def lineTo(self, point):
+        self._current.append(self._point(point))
+
+    def curveTo(self, *points):
+        x0, y0 = self._current[-1]
+        (x1, y1), (x2, y2), (x3, y3) = [self._point(point) for point in points]
+        for step in xrange(1, curveSteps + 1):
+            t = float(step) / curveSteps
+            u = 1 - t
+            self._current.append((
+                u * u * u * x0 + 3 * u * u * t * x1 + 3 * u * t * t * x2 + t * t * t * x3,
+                u * u * u * y0 + 3 * u * u * t * y1 + 3 * u * t * t * y2 + t * t * t * y3
+            ))
+
+    def qCurveTo(self, *points):
+        """A quadratic curve of off curve points and the end, like the TrueType corners of the generators, see splitQuadratic."""
+        for offCurve, onCurve in splitQuadratic(points):
+            x0, y0 = self._current[-1]
+            (x1, y1), (x2, y2) = self._point(offCurve), self._point(onCurve)
+            for step in xrange(1, curveSteps + 1):
+                t = float(step) / curveSteps
+                u = 1 - t
+                self._current.append((u * u * x0 + 2 * u * t * x1 + t * t * x2, u * u * y0 + 2 * u * t * y1 + t * t * y2))
+
+    def closePath(self):
+        self.polygons.append(self._current)
+        self._current = None
+
+class SVGPathPen(object):
+    """A pen that stores contours as the data of an SVG path, in pixels."""
+    def __init__(self, scale):
+        self.scale = scale
+        self.commands = []
+
+    def _point(self, point):
+        return '%s %s' % (_number(point[0] * self.scale), _number(-point[1] * self.scale))
+
+    def moveTo(self, point):
+        self.commands.append('M' + self._point(point))
+
+    def lineTo(self, point):
+        self.commands.append('L' + self._point(point))
+
+    def curveTo(self, *points):
+        self.commands.append('C' + ' '.join([self._point(point) for point in points]))
+
+    def qCurveTo(self, *points):
+        for offCurve, onCurve in splitQuadratic(points):
+            self.commands.append('Q' + self._point(offCurve) + ' ' + self._point(onCurve))
+
+    def closePath(self):
+        self.commands.append('Z')
+
+    def getData(self):
+        return ''.join(self.commands)
+
+def _number(value):
+    """Return value as short string for SVG, with at most 3 decimal places."""
+    result = ('%.3f' % value).rstrip('0').rstrip('.')
+    return '0' if result in ('', '-0') else result
+
+def getBounds(polygons):
+    """Return the bounds (xMin, yMin, xMax, yMax) of polygons, rounded outwards to whole pixels, or None if there are none."""
+    points = [point for polygon in polygons for point in polygon]
+    if not points:
+        return None
+    xs = [x for x, y in points]
+    ys = [y for x, y in points]
+    return (int(min(xs) // 1), int(min(ys) // 1), -int(-max(xs) // 1), -int(-max(ys) // 1))
+
+def rasterize(polygons, samples = 4):
+    """
+    Return a tuple (left, top, rows) of the coverage of the polygons.
+
+    rows is a list of rows of values from 0 (empty) to 255 (covered), left
+    and top are the pixel position of the first value. Each pixel is
+    sampled samples times in each direction.
+
+    """
+    bounds = getBounds(polygons)
+    if bounds is None:
+        return (0, 0, [])
+    left, top, right, bottom = bounds
+    width = right - left
+    #the edges sorted into the rows of pixels they cross: row : [(x0, y0, x1, y1, direction)]
+    rows = {}
+    for polygon in polygons:
+        for i in xrange(len(polygon)):
+            x0, y0 = polygon[i - 1]
+            x1, y1 = polygon[i]
+            if y0 == y1: continue
+            direction = 1
+            if y0 > y1:
+                x0, y0, x1, y1 = x1, y1, x0, y0
+                direction = -1
+            edge = (x0, y0, x1, y1, direction)
+            for row in xrange(int(y0 // 1), -int(-y1 // 1)):
+                rows.setdefault(row, []).append(edge)
+    subWidth = width * samples
+    full = samples * samples
+    result = []
+    for row in xrange(top, bottom):
+        edges = rows.get(row, ())
+        changes = [0] * (subWidth + 1)
+        for sample in xrange(samples):
+            y = row + (sample + 0.5) / samples
+            crossings = []
+            for x0, y0, x1, y1, direction in edges:
+                if y0 <= y < y1:
+                    crossings.append((x0 + (y - y0) * (x1 - x0) / (y1 - y0), direction))
+            crossings.sort()
+            winding = 0
+            for x, direction in crossings:
+                position = min(subWidth, max(0, int(round((x - left) * samples))))
+                if winding == 0:
+                    changes[position] += 1
+                winding += direction
+                if winding == 0:
+                    changes[position] -= 1
+        line = []
+        count = 0
+        covered = 0
+        for i in xrange(subWidth):
+            count += changes[i]
+            covered += count
+            if i % samples == samples - 1:
+                line.append(covered * 255 // full)
+                covered = 0
+        result.append(line)
+    return (left, top, result)
+
+def writePNG(fileName, width, height, rows):
+    """Write the rows (lists of gray values 0-255) as 8 bit grayscale PNG to fileName."""
+    def chunk(chunkType, data):
+        return struct.pack('>L', len(data)) + chunkType + data + struct.pack('>L', zlib.crc32(chunkType + data) & 0xFFFFFFFF)
+    raw = ''.join(['\0' + ''.join([chr(value) for value in row]) for row in rows])
+    with open(fileName, 'wb') as file:
+        file.write('\x89PNG\r\n\x1a\n')
+        file.write(chunk('IHDR', struct.pack('>LLBBBBB', width, height, 8, 0, 0, 0, 0)))
+        file.write(chunk('IDAT', zlib.compress(raw, 9)))
+        file.write(chunk('IEND', ''))
+
+def writeSVG(fileName, width, height, paths, uses, title = u''):
+    """
+    Write an SVG of width and height pixels to fileName.
+
+    paths is a list of path data, each is defined once and placed by uses,
+    a list of (index in paths, x, y).
+
+    """
+    lines = [
+        u'<?xml version="1.0" encoding="UTF-8"?>',
+        u'<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" version="1.1" '
+            u'width="{0}px" height="{1}px" viewBox="0 0 {0} {1}">'.format(width, height),
+        u'<title>{0}</title>'.format(escape(title)),
+        u'<defs>',
+    ]
+    for index, data in enumerate(paths):
+        lines.append(u'<path id="g{0}" d="{1}"/>'.format(index, data))
+    lines.append(u'</defs>')
+    lines.append(u'<rect width="100%" height="100%" fill="#fff"/>')
+    lines.append(u'<g fill="#000">')
+    for index, x, y in uses:
+        lines.append(u'<use xlink:href="#g{0}" x="{1}" y="{2}"/>'.format(index, _number(x), _number(y)))
+    lines.append(u'</g>')
+    lines.append(u'</svg>')
+    with open(fileName, 'wb') as file:
+        file.write(u'\n'.join(lines).encode('utf-8') + '\n')